@@ -1,111 +1,819 @@
 # DatabaseManager.py
+import asyncio
+import functools
+import glob
+import os
+import queue
+import re
 import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from threading import Lock
 
+from dateutil import parser as date_parser
+
+from Metrics import REGISTRY, STAGE_SECONDS
+
+GUID_QUERY_CHUNK = 500  # 单条 IN 查询的最大参数数
+SCHEMA_VERSION = 4  # PRAGMA user_version，用于一次性数据迁移
+ARCHIVE_BATCH_SIZE = 500  # 每批归档的记录数
+
+DB_ERRORS = REGISTRY.counter('news_db_errors_total', '数据库错误次数', ('op',))
+DB_CALL_SECONDS = REGISTRY.histogram('news_db_call_seconds', '数据库调用排队+执行耗时（秒）')
+VACUUM_PAGES = 1000  # 每次增量回收的页数
+
+# 写入语句保持为模块常量，使同一连接上的语句缓存命中
+INSERT_NEWS_SQL = '''
+    INSERT OR IGNORE INTO news 
+    (guid, title, description, link, pub_date, pub_ts, stock_tickers, media_url, source, seq)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+UPSERT_NEWS_SQL = '''
+    INSERT INTO news 
+    (guid, title, description, link, pub_date, pub_ts, stock_tickers, media_url, source, seq)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(guid) DO UPDATE SET
+        title = excluded.title,
+        description = excluded.description,
+        link = excluded.link,
+        pub_date = excluded.pub_date,
+        pub_ts = excluded.pub_ts,
+        stock_tickers = excluded.stock_tickers,
+        media_url = excluded.media_url,
+        source = excluded.source,
+        seq = excluded.seq
+'''
+INSERT_FTS_SQL = 'INSERT INTO news_fts (rowid, title, description) VALUES (?, ?, ?)'
+DELETE_FTS_SQL = '''
+    INSERT INTO news_fts (news_fts, rowid, title, description) VALUES ('delete', ?, ?, ?)
+'''
+INSERT_TICKER_SQL = 'INSERT OR IGNORE INTO news_tickers (ticker, pub_ts, guid) VALUES (?, ?, ?)'
+ARCHIVE_INSERT_SQL = '''
+    INSERT OR IGNORE INTO news 
+    (guid, title, description, link, pub_date, pub_ts, category, media_url, created_at, stock_tickers, source, seq)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+HISTORY_PAGE_SQL = '''
+    SELECT guid, title, description, link, 
+           pub_date as published, category, media_url 
+    FROM news 
+    ORDER BY pub_ts DESC, guid DESC 
+    LIMIT ? OFFSET ?
+'''
+
+# 增量重放：与 update 消息中的文章结构一致
+REPLAY_SQL = '''
+    SELECT guid, title, description, link, pub_date as published,
+           stock_tickers, media_url, source, seq
+    FROM news
+    WHERE seq > ?
+    ORDER BY seq
+    LIMIT ?
+'''
+ARTICLE_SQL = '''
+    SELECT guid, title, description, link, 
+           pub_date as published, category, media_url,
+           stock_tickers, source, seq
+    FROM news 
+    WHERE guid = ?
+'''
+ARTICLES_BY_GUIDS_SQL = '''
+    SELECT guid, title, description, link, 
+           pub_date as published, category, media_url,
+           stock_tickers, source, seq
+    FROM news 
+    WHERE guid IN ({placeholders})
+'''
+LAST_SEQ_SQL = "SELECT value FROM news_meta WHERE key = 'last_seq'"
+SET_LAST_SEQ_SQL = "INSERT OR REPLACE INTO news_meta (key, value) VALUES ('last_seq', ?)"
+
+# 历史/搜索结果的列，与 get_history_page 一致
+NEWS_COLUMNS = '''
+    n.guid, n.title, n.description, n.link,
+    n.pub_date as published, n.category, n.media_url
+'''
+
+
+def parse_timestamp(value):
+    """解析时间字符串为UTC时间：ISO-8601 走 fromisoformat 快速路径，其余回退 dateutil
+
+    非字符串或无法解析时统一抛出 ValueError。
+    """
+    if not isinstance(value, str):
+        raise ValueError(f"无效的时间: {value!r}")
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        try:
+            dt = date_parser.parse(value)
+        except OverflowError as e:
+            raise ValueError(f"无效的时间: {value!r}") from e
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def to_epoch(value):
+    """时间字符串 -> UTC 秒级整数时间戳"""
+    return int(parse_timestamp(value).timestamp())
+
+
+def _item_ts(item):
+    ts = item.get('pub_ts')
+    return ts if ts is not None else to_epoch(item['published'])
+
+
+def _news_params(item, seq=None):
+    return (
+        item['guid'],
+        item['title'],
+        item.get('description', ''),
+        item['link'],
+        item['published'],
+        _item_ts(item),
+        item.get('stock_tickers', ''),
+        item.get('media_url', ''),
+        item.get('source', 'rss'),
+        seq
+    )
+
+
+def to_history_row(item):
+    """将待写入条目转换为与 get_history_page 相同的行结构"""
+    return {
+        "guid": item['guid'],
+        "title": item['title'],
+        "description": item.get('description', ''),
+        "link": item['link'],
+        "published": item['published'],
+        "category": None,
+        "media_url": item.get('media_url', '')
+    }
+
+
+def normalize_tickers(stock_tickers):
+    """规范化股票代码：'NASDAQ:aapl, IBM' -> {'NASDAQ:AAPL', 'AAPL', 'IBM'}"""
+    tickers = set()
+    for raw in (stock_tickers or '').split(','):
+        ticker = raw.strip().upper()
+        if not ticker:
+            continue
+        tickers.add(ticker)
+        if ':' in ticker:
+            tickers.add(ticker.rsplit(':', 1)[1].strip())
+    tickers.discard('')
+    return tickers
+
+
+def fts_query(text):
+    """将用户输入转换为安全的 FTS5 查询（各词条 AND，末词前缀匹配）"""
+    terms = re.findall(r'\w+', text or '')
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _index_news(conn, rowid, item):
+    """写入全文索引与股票代码倒排表"""
+    conn.execute(INSERT_FTS_SQL, (rowid, item['title'], item.get('description', '')))
+    conn.executemany(INSERT_TICKER_SQL, [
+        (ticker, _item_ts(item), item['guid'])
+        for ticker in normalize_tickers(item.get('stock_tickers', ''))
+    ])
+
+
+def _last_seq(conn):
+    row = conn.execute(LAST_SEQ_SQL).fetchone()
+    if row:
+        return row[0]
+    # 计数器缺失时以现有最大序列号为准
+    return conn.execute('SELECT COALESCE(MAX(seq), 0) FROM news').fetchone()[0]
+
+
+def _fetch_rows(conn, sql, params):
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute(sql, params)
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def _articles_by_guids(conn, guids):
+    """批量按 GUID 查询详情，返回 {guid: article}"""
+    found = {}
+    for i in range(0, len(guids), GUID_QUERY_CHUNK):
+        chunk = guids[i:i + GUID_QUERY_CHUNK]
+        sql = ARTICLES_BY_GUIDS_SQL.format(placeholders=','.join('?' * len(chunk)))
+        found.update((row['guid'], row) for row in _fetch_rows(conn, sql, chunk))
+    return found
+
+
+def _history_before(conn, before_ts, before_guid, limit):
+    """在指定连接上执行游标分页查询"""
+    if before_ts is None:
+        return _fetch_rows(conn, '''
+            SELECT guid, title, description, link, 
+                   pub_date as published, category, media_url 
+            FROM news 
+            ORDER BY pub_ts DESC, guid DESC 
+            LIMIT ?
+        ''', (limit,))
+    return _fetch_rows(conn, '''
+        SELECT guid, title, description, link, 
+               pub_date as published, category, media_url 
+        FROM news 
+        WHERE (pub_ts, guid) < (?, ?)
+        ORDER BY pub_ts DESC, guid DESC 
+        LIMIT ?
+    ''', (before_ts, before_guid or '', limit))
+
 
 class DatabaseManager:
-    def __init__(self, db_path='news.db'):
+    def __init__(self, db_path='news.db', pooled=False, pool_size=4, archive_dir='archive', read_only=False):
+        """
+        pooled=False: 每次调用新建连接（兼容旧行为）
+        pooled=True: 长连接读池(WAL) + 单写线程
+        archive_dir: 超出保留窗口的数据按月归档到 archive_dir/news-YYYY-MM.db
+        read_only=True: 以 mode=ro 打开，不建表、不迁移、不启动写线程（库须已由写入方初始化）
+        """
         self.db_path = db_path
         self.lock = Lock()
+        self.pooled = pooled
+        self.read_only = read_only
+        self.archive_dir = archive_dir
+        self._save_listeners = []
+        self._archive_lock = Lock()
+        self._archive_counts = {}  # 归档分区路径 -> (文件签名, 记录数)
+
+        if read_only:
+            if pooled:
+                self._init_readers(pool_size)
+            return
 
-        # 初始化数据库
+        # 初始化数据库（归档分区同样执行迁移）
         with self._get_conn() as conn:
-            with open('schema.sql') as f:
-                conn.executescript(f.read())
+            self._init_schema(conn)
+        for path in self._archive_paths():
+            conn = self._get_conn(path)
+            try:
+                self._init_schema(conn)
+            finally:
+                conn.close()
 
-    def _get_conn(self):
+        if pooled:
+            self._init_pool(pool_size)
+
+    def _get_conn(self, path=None):
+        if self.read_only:
+            return sqlite3.connect(
+                f'file:{path or self.db_path}?mode=ro', uri=True,
+                check_same_thread=False, isolation_level=None
+            )
         return sqlite3.connect(
-            self.db_path,
+            path or self.db_path,
             check_same_thread=False,  # 允许多线程访问
             isolation_level=None  # 自动提交模式
         )
+
+    @classmethod
+    def _init_schema(cls, conn):
+        """建表并执行迁移（主库与归档库共用）"""
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')  # 仅对新建库生效
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        cls._migrate_tables(conn, version)
+        with open('schema.sql') as f:
+            conn.executescript(f.read())
+        cls._migrate(conn, version)
+
+    @staticmethod
+    def _migrate_tables(conn, version):
+        """建表前的结构迁移（schema.sql 中的索引依赖新列）"""
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(news)')}
+        if columns and 'pub_ts' not in columns:
+            conn.execute('ALTER TABLE news ADD COLUMN pub_ts INTEGER')
+        if columns and 'seq' not in columns:
+            conn.execute('ALTER TABLE news ADD COLUMN seq INTEGER')
+        if version < 3:
+            # 倒排表主键改为 (ticker, pub_ts, guid)，由 schema.sql 重建后回填
+            conn.execute('DROP TABLE IF EXISTS news_tickers')
+            conn.execute('DROP INDEX IF EXISTS idx_pub_date_guid')
+
+    @staticmethod
+    def _migrate(conn, version):
+        """按 user_version 执行一次性数据迁移"""
+        if version < 1:
+            # 为已有数据建立全文索引
+            conn.execute("INSERT INTO news_fts (news_fts) VALUES ('rebuild')")
+        if version < 3:
+            # 回填整数时间戳并重建股票代码倒排表
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute('SELECT guid, pub_date, stock_tickers FROM news').fetchall()
+            timestamps = {guid: to_epoch(pub_date) for guid, pub_date, _ in rows}
+            conn.executemany(
+                'UPDATE news SET pub_ts = ? WHERE guid = ?',
+                [(ts, guid) for guid, ts in timestamps.items()]
+            )
+            conn.executemany(INSERT_TICKER_SQL, [
+                (ticker, timestamps[guid], guid)
+                for guid, _, stock_tickers in rows
+                for ticker in normalize_tickers(stock_tickers)
+            ])
+            conn.execute('COMMIT')
+        if version < 4:
+            # 按发布时间为已有数据回填序列号
+            conn.execute('BEGIN IMMEDIATE')
+            last_seq = _last_seq(conn)
+            guids = conn.execute(
+                'SELECT guid FROM news WHERE seq IS NULL ORDER BY pub_ts, guid'
+            ).fetchall()
+            conn.executemany('UPDATE news SET seq = ? WHERE guid = ?', [
+                (last_seq + i, guid) for i, (guid,) in enumerate(guids, 1)
+            ])
+            conn.execute(SET_LAST_SEQ_SQL, (last_seq + len(guids),))
+            conn.execute('COMMIT')
+        if version < 2 and conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            # 已有库切换为增量回收模式，需要一次完整 VACUUM
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def _init_pool(self, pool_size):
+        """初始化读连接池与写线程"""
+        self._writer_conn = self._get_conn()
+        self._writer_conn.execute('PRAGMA journal_mode=WAL')
+        self._writer_conn.execute('PRAGMA synchronous=NORMAL')
+
+        self._init_readers(pool_size)
+
+        self._write_queue = queue.Queue()
+        self._writer_thread = threading.Thread(
+            target=self._writer_loop, name='db-writer', daemon=True
+        )
+        self._writer_thread.start()
+
+    def _init_readers(self, pool_size):
+        self._readers = queue.Queue()
+        for _ in range(pool_size):
+            conn = self._get_conn()
+            conn.execute('PRAGMA query_only=ON')
+            self._readers.put(conn)
+
+    def _writer_loop(self):
+        """单写线程：串行执行所有写任务"""
+        conn = self._writer_conn
+        while True:
+            job = self._write_queue.get()
+            if job is None:
+                break
+            func, args, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._run_write(conn, func, args))
+            except BaseException as e:
+                future.set_exception(e)
+
+    @staticmethod
+    def _run_write(conn, func, args):
+        """在显式事务中执行写任务"""
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = func(conn, *args)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return result
+
+    def _write(self, func, *args):
+        """执行写任务，池化模式下交给写线程"""
+        if self.read_only:
+            raise sqlite3.OperationalError('数据库以只读模式打开')
+        if not self.pooled:
+            with self.lock, self._get_conn() as conn:
+                return func(conn, *args)
+        if threading.current_thread() is self._writer_thread:
+            return func(self._writer_conn, *args)
+        future = Future()
+        self._write_queue.put((func, args, future))
+        return future.result()
+
+    @contextmanager
+    def _reader(self):
+        """获取读连接，池化模式下不占用写锁"""
+        if not self.pooled:
+            with self.lock, self._get_conn() as conn:
+                yield conn
+            return
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    def _archive_paths(self):
+        """归档分区路径，按月份倒序"""
+        return sorted(glob.glob(os.path.join(self.archive_dir, 'news-*.db')), reverse=True)
+
+    @contextmanager
+    def _archive_reader(self, path):
+        """只读打开归档分区"""
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _archive_signature(path):
+        """分区文件（含 WAL）的修改时间与大小，任一进程写入后即变化"""
+        signature = []
+        for name in (path, f'{path}-wal'):
+            try:
+                stat = os.stat(name)
+            except FileNotFoundError:
+                continue
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def _archive_count_list(self):
+        """[(归档分区路径, 记录数)]，按月份倒序；计数按文件签名缓存，分区被写入后重新统计"""
+        result = []
+        for path in self._archive_paths():
+            signature = self._archive_signature(path)
+            with self._archive_lock:
+                cached = self._archive_counts.get(path)
+            if cached is not None and cached[0] == signature:
+                count = cached[1]
+            else:
+                with self._archive_reader(path) as conn:
+                    count = conn.execute('SELECT COUNT(*) FROM news').fetchone()[0]
+                with self._archive_lock:
+                    self._archive_counts[path] = (signature, count)
+            result.append((path, count))
+        return result
+
+    def _spill_to_archives(self, rows, limit, before_ts, before_guid, query):
+        """热表不足一页时，沿游标继续按时间倒序查询归档分区"""
+        for path in self._archive_paths():
+            if len(rows) >= limit:
+                break
+            if rows:
+                before_ts, before_guid = to_epoch(rows[-1]['published']), rows[-1]['guid']
+            with self._archive_reader(path) as conn:
+                rows += query(conn, before_ts, before_guid, limit - len(rows))
+        return rows
+
+    def _copy_to_archive(self, month, rows):
+        """将记录写入对应月份的归档库（可重复执行）"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f'news-{month}.db')
+        conn = self._get_conn(path)
+        try:
+            self._init_schema(conn)
+            conn.execute('BEGIN IMMEDIATE')
+            for row in rows:
+                cursor = conn.execute(ARCHIVE_INSERT_SQL, (
+                    row['guid'], row['title'], row['description'], row['link'],
+                    row['pub_date'], row['pub_ts'], row['category'], row['media_url'],
+                    row['created_at'], row['stock_tickers'], row['source'], row['seq']
+                ))
+                if cursor.rowcount > 0:
+                    _index_news(conn, cursor.lastrowid, {**row, 'published': row['pub_date']})
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    def archive_before(self, cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+        """将一批发布时间早于 cutoff 的记录移入归档库，返回迁移条数"""
+        cutoff_ts = to_epoch(cutoff)
+
+        def _archive(conn):
+            rows = _fetch_rows(conn, '''
+                SELECT rowid, * FROM news WHERE pub_ts < ? ORDER BY pub_ts LIMIT ?
+            ''', (cutoff_ts, batch_size))
+            if not rows:
+                return 0
+            # 先写归档再删热表，中途失败重跑不会丢数据
+            by_month = {}
+            for row in rows:
+                month = datetime.fromtimestamp(row['pub_ts'], timezone.utc).strftime('%Y-%m')
+                by_month.setdefault(month, []).append(row)
+            for month, part in by_month.items():
+                self._copy_to_archive(month, part)
+            conn.executemany(DELETE_FTS_SQL, [
+                (row['rowid'], row['title'], row['description']) for row in rows
+            ])
+            guids = [(row['guid'],) for row in rows]
+            conn.executemany('DELETE FROM news_tickers WHERE guid = ?', guids)
+            conn.executemany('DELETE FROM news WHERE guid = ?', guids)
+            return len(rows)
+
+        moved = self._write(_archive)
+        if moved:
+            self._notify_saved([], replaced=True)
+        return moved
+
+    def incremental_vacuum(self, pages=VACUUM_PAGES):
+        """增量回收空闲页"""
+        self._write(lambda conn: conn.execute(f'PRAGMA incremental_vacuum({int(pages)})').fetchall())
+
+    def close(self):
+        """关闭连接池与写线程"""
+        if not self.pooled:
+            return
+        if not self.read_only:
+            self._write_queue.put(None)
+            self._writer_thread.join()
+            self._writer_conn.close()
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+
     def get_total_count(self):
-        """获取总记录数"""
-        with self._get_conn() as conn:
+        """获取总记录数（含归档）"""
+        with self._reader() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT COUNT(*) FROM news")
-            return cursor.fetchone()[0]
+            live = cursor.fetchone()[0]
+        return live + sum(count for _, count in self._archive_count_list())
 
-    def save_news(self, items):
-        """批量保存新闻"""
-        with self.lock, self._get_conn() as conn:
+    def add_save_listener(self, listener):
+        """注册写入回调 listener(items, replaced)，写入提交后调用"""
+        self._save_listeners.append(listener)
+
+    def _notify_saved(self, items, replaced=False):
+        for listener in self._save_listeners:
             try:
-                conn.executemany('''
-                    INSERT OR IGNORE INTO news 
-                    (guid, title, link, pub_date, stock_tickers, media_url, source)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', [
-                    (
-                        item['guid'],
-                        item['title'],
-                        item['link'],
-                        item['published'],
-                        item.get('stock_tickers', ''),
-                        item.get('media_url', ''),
-                        item.get('source', 'rss')
-                    ) for item in items
-                ])
-            except sqlite3.Error as e:
-                print(f"Database error: {e}")
+                listener(items, replaced)
+            except Exception as e:
+                print(f"写入回调异常: {e}")
+
+    def save_news(self, items):
+        """批量保存新闻，返回实际插入的条目（附带分配的序列号 seq）"""
+        def _save(conn, items):
+            inserted = []
+            seq = _last_seq(conn)
+            for item in items:
+                cursor = conn.execute(INSERT_NEWS_SQL, _news_params(item, seq + 1))
+                if cursor.rowcount > 0:
+                    seq += 1
+                    _index_news(conn, cursor.lastrowid, item)
+                    inserted.append({**item, 'seq': seq})
+            if inserted:
+                conn.execute(SET_LAST_SEQ_SQL, (seq,))
+            return inserted
+
+        try:
+            with STAGE_SECONDS.time(stage='save'):
+                inserted = self._write(_save, items)
+        except sqlite3.Error as e:
+            DB_ERRORS.inc(op='save')
+            print(f"Database error: {e}")
+            return []
+        if inserted:
+            self._notify_saved(inserted)
+        return inserted
+
     def get_news_by_guid(self, guid: str):
-        """根据 GUID 获取新闻"""
-        with self.lock, self._get_conn() as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute('''
-                SELECT guid, title, description, link, 
-                       pub_date as published, category, media_url 
-                FROM news 
-                WHERE guid = ?
-            ''', (guid,))
+        """根据 GUID 获取新闻详情（含股票代码与来源）"""
+        with self._reader() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute(ARTICLE_SQL, (guid,))
             row = cursor.fetchone()
-            return dict(row) if row else None
+        if row:
+            return dict(row)
+        for path in self._archive_paths():
+            with self._archive_reader(path) as conn:
+                rows = _fetch_rows(conn, ARTICLE_SQL, (guid,))
+            if rows:
+                return rows[0]
+        return None
 
+    def get_news_by_guids(self, guids):
+        """批量获取新闻详情：热表一次 IN 查询，未命中的再逐个归档分区查询，返回 {guid: article}"""
+        guids = list(dict.fromkeys(guids))
+        with self._reader() as conn:
+            found = _articles_by_guids(conn, guids)
+        for path in self._archive_paths():
+            remaining = [guid for guid in guids if guid not in found]
+            if not remaining:
+                break
+            with self._archive_reader(path) as conn:
+                found.update(_articles_by_guids(conn, remaining))
+        return found
 
     def update_or_insert_news(self, item):
         """更新或插入新闻"""
-        with self.lock, self._get_conn() as conn:
-            try:
-                conn.execute('''
-                    INSERT INTO news 
-                    (guid, title, link, pub_date, stock_tickers, media_url, source)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    ON CONFLICT(guid) DO UPDATE SET
-                        title = excluded.title,
-                        link = excluded.link,
-                        pub_date = excluded.pub_date,
-                        stock_tickers = excluded.stock_tickers,
-                        media_url = excluded.media_url,
-                        source = excluded.source
-                ''', (
-                    item['guid'],
-                    item['title'],
-                    item['link'],
-                    item['published'],
-                    item.get('stock_tickers', ''),
-                    item.get('media_url', ''),
-                    item.get('source', 'rss')
-                ))
-            except sqlite3.Error as e:
-                print(f"Database error: {e}")
+        def _upsert(conn, item):
+            old = conn.execute(
+                'SELECT rowid, title, description FROM news WHERE guid = ?', (item['guid'],)
+            ).fetchone()
+            if old:
+                conn.execute(DELETE_FTS_SQL, old)
+                conn.execute('DELETE FROM news_tickers WHERE guid = ?', (item['guid'],))
+            seq = _last_seq(conn) + 1
+            conn.execute(UPSERT_NEWS_SQL, _news_params(item, seq))
+            conn.execute(SET_LAST_SEQ_SQL, (seq,))
+            rowid = conn.execute(
+                'SELECT rowid FROM news WHERE guid = ?', (item['guid'],)
+            ).fetchone()[0]
+            _index_news(conn, rowid, item)
+
+        try:
+            self._write(_upsert, item)
+        except sqlite3.Error as e:
+            DB_ERRORS.inc(op='upsert')
+            print(f"Database error: {e}")
+            return
+        self._notify_saved([item], replaced=True)
+
     def is_news_exists(self, guid):
         """检查新闻是否存在"""
-        with self.lock, self._get_conn() as conn:
+        with self._reader() as conn:
             cursor = conn.execute('SELECT COUNT(*) FROM news WHERE guid = ?', (guid,))
             return cursor.fetchone()[0] > 0
 
+    def get_existing_guids(self, guids):
+        """批量检查GUID，返回已存在的集合"""
+        existing = set()
+        guids = list(guids)
+        with self._reader() as conn:
+            for i in range(0, len(guids), GUID_QUERY_CHUNK):
+                chunk = guids[i:i + GUID_QUERY_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                cursor = conn.execute(
+                    f'SELECT guid FROM news WHERE guid IN ({placeholders})', chunk
+                )
+                existing.update(row[0] for row in cursor)
+        return existing
+
+    def get_recent_guids(self, limit):
+        """获取最新的GUID（按发布时间升序返回）"""
+        with self._reader() as conn:
+            cursor = conn.execute(
+                'SELECT guid FROM news ORDER BY pub_ts DESC LIMIT ?', (limit,)
+            )
+            return [row[0] for row in cursor.fetchall()][::-1]
+
+    def get_last_seq(self):
+        """获取最近分配的序列号"""
+        with self._reader() as conn:
+            return _last_seq(conn)
+
+    def get_news_since_seq(self, seq, limit):
+        """按序列号升序获取 seq 之后的新闻（断线重连补发）"""
+        with self._reader() as conn:
+            return _fetch_rows(conn, REPLAY_SQL, (seq, limit))
+
+    def count_recent_by_source(self, since_ts):
+        """统计 since_ts 之后各数据源的发布条数"""
+        with self._reader() as conn:
+            cursor = conn.execute(
+                'SELECT source, COUNT(*) FROM news WHERE pub_ts >= ? GROUP BY source', (since_ts,)
+            )
+            return dict(cursor.fetchall())
+
     def get_history_page(self, offset, limit):
-        """分页获取历史数据"""
-        with self.lock, self._get_conn() as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute('''
-                SELECT guid, title, description, link, 
-                       pub_date as published, category, media_url 
-                FROM news 
-                ORDER BY pub_date DESC 
-                LIMIT ? OFFSET ?
-            ''', (limit, offset))
-            return [dict(row) for row in cursor.fetchall()]
+        """分页获取历史数据，超出热表部分从归档分区读取"""
+        with self._reader() as conn:
+            rows = _fetch_rows(conn, HISTORY_PAGE_SQL, (limit, offset))
+            if len(rows) >= limit or not self._archive_paths():
+                return rows
+            if rows:
+                live_total = offset + len(rows)
+            else:
+                live_total = conn.execute('SELECT COUNT(*) FROM news').fetchone()[0]
+
+        skip = max(0, offset - live_total)
+        for path, count in self._archive_count_list():
+            if len(rows) >= limit:
+                break
+            if skip >= count:
+                skip -= count
+                continue
+            with self._archive_reader(path) as conn:
+                rows += _fetch_rows(conn, HISTORY_PAGE_SQL, (limit - len(rows), skip))
+            skip = 0
+        return rows
+
+    def get_history_before(self, before_pub_date, before_guid, limit):
+        """游标分页：返回 (pub_ts, guid) 严格早于游标的记录"""
+        before_ts = to_epoch(before_pub_date) if before_pub_date else None
+        with self._reader() as conn:
+            rows = _history_before(conn, before_ts, before_guid, limit)
+        return self._spill_to_archives(rows, limit, before_ts, before_guid, _history_before)
+
+    def search_news(self, query=None, tickers=None, since=None,
+                    before_pub_date=None, before_guid=None, limit=100):
+        """全文/股票代码搜索，按 (pub_ts, guid) 游标倒序分页"""
+        match = fts_query(query)
+        ticker_set = set()
+        for ticker in tickers or []:
+            ticker_set |= normalize_tickers(ticker)
+        if not match and not ticker_set:
+            return []
+
+        since_ts = to_epoch(since) if since else None
+
+        def _query(conn, before_ts, before_guid, limit):
+            prefix = 'n.' if match else ''
+            clauses, values = [], []
+            if before_ts is not None:
+                clauses.append(f'({prefix}pub_ts, {prefix}guid) < (?, ?)')
+                values += [before_ts, before_guid or '']
+            if since_ts is not None:
+                clauses.append(f'{prefix}pub_ts >= ?')
+                values.append(since_ts)
+
+            ticker_marks = ','.join('?' * len(ticker_set))
+            if match:
+                # 全文检索，可叠加股票代码过滤
+                where = ['news_fts MATCH ?'] + clauses
+                params = [match] + values
+                if ticker_set:
+                    where.append(f'n.guid IN (SELECT guid FROM news_tickers WHERE ticker IN ({ticker_marks}))')
+                    params += sorted(ticker_set)
+                sql = f'''
+                    SELECT {NEWS_COLUMNS} FROM news_fts
+                    JOIN news n ON n.rowid = news_fts.rowid
+                    WHERE {' AND '.join(where)}
+                '''
+            else:
+                # 仅股票代码：直接在倒排表的 (ticker, pub_ts) 主键上查找
+                where = [f'ticker IN ({ticker_marks})'] + clauses
+                params = sorted(ticker_set) + values + [limit]
+                sql = f'''
+                    SELECT {NEWS_COLUMNS} FROM (
+                        SELECT DISTINCT pub_ts, guid FROM news_tickers
+                        WHERE {' AND '.join(where)}
+                        ORDER BY pub_ts DESC, guid DESC
+                        LIMIT ?
+                    ) t JOIN news n ON n.guid = t.guid
+                '''
+            sql += ' ORDER BY n.pub_ts DESC, n.guid DESC LIMIT ?'
+            return _fetch_rows(conn, sql, params + [limit])
+
+        before_ts = to_epoch(before_pub_date) if before_pub_date else None
+        with self._reader() as conn:
+            rows = _query(conn, before_ts, before_guid, limit)
+        return self._spill_to_archives(rows, limit, before_ts, before_guid, _query)
 
     def get_history(self, limit=1000):
         """获取历史新闻"""
-        return self.get_history_page(0, limit)
\ No newline at end of file
+        return self.get_history_page(0, limit)
+
+
+class AsyncDatabaseManager:
+    """DatabaseManager 的异步封装：专用线程池 + 并发上限，避免阻塞事件循环"""
+
+    def __init__(self, db: DatabaseManager, max_workers=4):
+        self.db = db
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db')
+        self.semaphore = asyncio.Semaphore(max_workers)
+        # 排队等待 / 线程内执行 / 协程总等待耗时（秒）
+        self.stats = {"calls": 0, "queue_seconds": 0.0, "exec_seconds": 0.0, "wait_seconds": 0.0}
+
+    async def run(self, func, *args, **kwargs):
+        """在数据库线程池中执行任意阻塞调用"""
+        loop = asyncio.get_running_loop()
+        queued = time.perf_counter()
+        call = functools.partial(func, *args, **kwargs)
+        async with self.semaphore:
+            try:
+                result, started, finished = await loop.run_in_executor(self.executor, _timed_call, call)
+            except sqlite3.Error:
+                DB_ERRORS.inc(op=getattr(func, '__name__', 'call'))
+                raise
+        DB_CALL_SECONDS.observe(time.perf_counter() - queued)
+        stats = self.stats
+        stats["calls"] += 1
+        stats["queue_seconds"] += started - queued
+        stats["exec_seconds"] += finished - started
+        stats["wait_seconds"] += time.perf_counter() - queued
+        return result
+
+    def __getattr__(self, name):
+        """将 DatabaseManager 的方法代理为协程"""
+        method = getattr(self.db, name)
+        if not callable(method):
+            return method
+
+        async def _proxy(*args, **kwargs):
+            return await self.run(method, *args, **kwargs)
+
+        return _proxy
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.db.close()
+
+
+def _timed_call(call):
+    started = time.perf_counter()
+    result = call()
+    return result, started, time.perf_counter()
@@ -0,0 +1,133 @@
+"""进程间新文章分发：抓取主进程经 Unix 套接字推送给各 WebSocket 工作进程
+
+消息为按行分隔的 JSON；主进程 -> 工作进程推送新文章/缓存失效，
+工作进程 -> 主进程转发 reload 等请求。
+"""
+import asyncio
+import os
+
+from WireFormats import dumps_json, loads
+
+CHANNEL_RECONNECT_DELAY = 1  # 工作进程重连间隔（秒）
+CHANNEL_LINE_LIMIT = 2 ** 24  # 单条消息上限（字节）
+CHANNEL_MAX_BUFFER = 2 ** 24  # 单个工作进程未发送积压上限，超出则断开让其重连补齐
+
+
+def _frame(message):
+    return (dumps_json(message) + '\n').encode()
+
+
+class IngestPublisher:
+    """抓取主进程侧：接受工作进程连接并广播消息"""
+
+    def __init__(self, path, on_request=None):
+        self.path = path
+        self.on_request = on_request  # async def on_request(message)
+        self.server = None
+        self._writers = set()
+
+    def __len__(self):
+        return len(self._writers)
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)  # 清理上次未正常退出遗留的套接字文件
+        self.server = await asyncio.start_unix_server(
+            self._handle, self.path, limit=CHANNEL_LINE_LIMIT
+        )
+
+    async def _handle(self, reader, writer):
+        self._writers.add(writer)
+        print(f"工作进程已连接，共 {len(self._writers)} 个")
+        try:
+            while line := await reader.readline():
+                try:
+                    message = loads(line.decode())
+                except ValueError:
+                    print(f"无效的通道消息: {line[:50]!r}")
+                    continue
+                if self.on_request:
+                    await self.on_request(message)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+            print(f"工作进程断开，剩余 {len(self._writers)} 个")
+
+    def publish(self, message):
+        """向所有工作进程写入同一份编码，积压过多的连接直接断开"""
+        data = _frame(message)
+        for writer in list(self._writers):
+            if writer.is_closing():
+                self._writers.discard(writer)
+                continue
+            if writer.transport.get_write_buffer_size() > CHANNEL_MAX_BUFFER:
+                print("工作进程消费过慢，断开连接")
+                self._writers.discard(writer)
+                writer.close()
+                continue
+            writer.write(data)
+        return len(self._writers)
+
+    async def close(self):
+        for writer in list(self._writers):
+            writer.close()
+        self._writers.clear()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class IngestSubscriber:
+    """工作进程侧：保持到主进程的连接，断线自动重连"""
+
+    def __init__(self, path, on_message, on_connect=None):
+        self.path = path
+        self.on_message = on_message  # def on_message(message)
+        self.on_connect = on_connect  # async def on_connect()，用于重连后补齐
+        self._writer = None
+
+    @property
+    def connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def run(self):
+        while True:
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(
+                    self.path, limit=CHANNEL_LINE_LIMIT
+                )
+                if self.on_connect:
+                    await self.on_connect()
+                while line := await reader.readline():
+                    try:
+                        self.on_message(loads(line.decode()))
+                    except ValueError:
+                        print(f"无效的通道消息: {line[:50]!r}")
+                    except Exception as e:
+                        # 单条消息处理失败不应断开订阅
+                        print(f"处理通道消息失败: {type(e).__name__}: {str(e)}")
+                print("与抓取进程的连接已断开")
+            except asyncio.CancelledError:
+                raise
+            except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                print(f"连接抓取进程失败: {str(e)}")
+            except Exception as e:
+                # 补齐（如 sqlite3.Error）等任何异常都只记录并重连，订阅任务不能退出
+                print(f"订阅抓取进程出错，稍后重连: {type(e).__name__}: {str(e)}")
+            finally:
+                if self._writer:
+                    self._writer.close()
+                    self._writer = None
+            await asyncio.sleep(CHANNEL_RECONNECT_DELAY)
+
+    async def request(self, message):
+        """向主进程发送请求，未连接时返回 False"""
+        if not self.connected:
+            return False
+        self._writer.write(_frame(message))
+        await self._writer.drain()
+        return True
@@ -0,0 +1,494 @@
+# NewsSources.py
+import asyncio
+import os
+import time
+from urllib.parse import urlparse
+from xml.etree import ElementTree as ET
+
+import aiohttp
+import dotenv
+import feedparser
+
+from DatabaseManager import parse_timestamp
+from Metrics import REGISTRY, STAGE_SECONDS
+
+dotenv.load_dotenv()
+# 数据源配置
+SITEMAP_STREAMING = os.getenv('SITEMAP_STREAMING', '1') == '1'  # 流式解析站点地图
+SITEMAP_KNOWN_RUN = int(os.getenv('SITEMAP_KNOWN_RUN', 50))  # 连续遇到多少条已知GUID后停止解析（0为不提前结束）
+SITEMAP_CHUNK_SIZE = 16 * 1024  # 流式读取块大小
+SITEMAP_NAMESPACES = {
+    'ns': 'http://www.sitemaps.org/schemas/sitemap/0.9',
+    'news': 'http://www.google.com/schemas/sitemap-news/0.9',
+    'image': 'http://www.google.com/schemas/sitemap-image/1.1'
+}
+SITEMAP_URL_TAG = f"{{{SITEMAP_NAMESPACES['ns']}}}url"
+SITEMAP_LOC_TAG = f"{{{SITEMAP_NAMESPACES['ns']}}}loc"
+SOURCE_TIMEOUT = 10  # 单个数据源抓取超时（秒）
+SOURCE_CONCURRENCY = int(os.getenv('SOURCE_CONCURRENCY', 8))  # 同时抓取的数据源上限
+SOURCE_BACKOFF_BASE = 30  # 失败退避基数（秒）
+SOURCE_BACKOFF_MAX = 900  # 失败退避上限（秒）
+INGEST_CYCLE_DEADLINE = 5  # 每轮等待数据源的最长时间，超时的源结果并入下一轮
+FORCE_MIN_INTERVAL = int(os.getenv('FORCE_MIN_INTERVAL', 30))  # 两次强制抓取之间的最短间隔（秒，全局，不分连接）
+POLL_INITIAL = 60  # 初始轮询间隔（秒）
+POLL_FLOOR = int(os.getenv('POLL_FLOOR', 10))  # 突发时的最短轮询间隔（秒）
+POLL_CEILING = int(os.getenv('POLL_CEILING', 600))  # 空闲时的最长轮询间隔（秒）
+POLL_LEARN_WINDOW = 3 * 3600  # 学习发布速率的历史窗口（秒）
+POLL_RELEARN_INTERVAL = 600  # 重新学习发布速率的间隔（秒）
+POLL_GAP_FACTOR = 0.5  # 基准间隔 = 平均发布间隔 * 系数
+POLL_BURST_FACTOR = 0.5  # 有新文章时间隔缩短系数
+POLL_QUIET_FACTOR = 1.5  # 无新文章时间隔放大系数
+POLL_QUIET_CAP = 2  # 无新文章时最多放大到基准间隔的倍数
+
+SOURCE_ERRORS = REGISTRY.counter('news_source_errors_total', '数据源抓取失败次数（HTTP/超时/解析）', ('source',))
+SOURCE_FETCH_SECONDS = REGISTRY.histogram('news_source_fetch_seconds', '单个数据源抓取+解析耗时（秒）', ('source',))
+ARTICLES_TOTAL = REGISTRY.counter('news_articles_total', '各阶段处理的文章数', ('stage',))
+
+
+def normalize_link(link):
+    """规范化文章地址：去掉协议、查询串、片段与末尾的 /，主机名小写"""
+    parsed = urlparse(link.strip())
+    return f"{parsed.netloc.lower()}{parsed.path.rstrip('/')}"
+
+
+def link_host(link):
+    """地址的主机名（小写、去掉 www.），用于判断是否属于历史站点地图的站点"""
+    host = urlparse(link.strip()).netloc.lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def guid_from_link(link, legacy=False):
+    """由文章地址生成GUID
+
+    legacy=True: 沿用 Bloomberg 站点地图的历史规则，取路径最后一段（与已入库数据保持一致）；
+    其余数据源使用带主机名的完整规范化地址，避免 index.html 之类的末段跨站冲突。
+    """
+    normalized = normalize_link(link)
+    if legacy:
+        return normalized.rsplit("/", 1)[-1]
+    return normalized
+
+
+class NewsSource:
+    """数据源基类：维护超时、退避与健康状态"""
+    kind = None
+    legacy_guid = False
+
+    def __init__(self, name, url, timeout=SOURCE_TIMEOUT):
+        self.name = name
+        self.url = url
+        self.timeout = timeout
+        self.validators = {}  # 条件请求缓存: ETag / Last-Modified
+        self.failures = 0
+        self.last_error = None
+        self.last_success = None
+        self.last_count = 0
+        self.next_run = 0.0  # time.monotonic()，早于该时间不抓取
+        self.started_at = 0.0  # 最近一轮抓取的开始时间
+        self.legacy_hosts = set()  # 沿用末段GUID规则的站点（由注册表共享）
+
+    def _guid(self, link):
+        """历史站点地图及其站点上的文章（无论来自哪个源）使用末段GUID，保证跨源去重"""
+        legacy = self.legacy_guid or link_host(link) in self.legacy_hosts
+        return guid_from_link(link, legacy=legacy)
+
+    def is_due(self, now):
+        return now >= self.next_run
+
+    def record_success(self, count):
+        self.failures = 0
+        self.last_error = None
+        self.last_success = time.time()
+        self.last_count = count
+
+    def record_failure(self, error):
+        self.failures += 1
+        self.last_error = str(error) or type(error).__name__
+        delay = min(SOURCE_BACKOFF_BASE * 2 ** (self.failures - 1), SOURCE_BACKOFF_MAX)
+        self.next_run = max(self.next_run, time.monotonic() + delay)
+
+    def health(self):
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "healthy": self.failures == 0,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_success": self.last_success,
+            "last_count": self.last_count
+        }
+
+    async def _get(self, session, handler):
+        """条件GET：304 返回空列表，其余交给 handler(resp) 解析"""
+        headers = {}
+        if self.validators.get("etag"):
+            headers["If-None-Match"] = self.validators["etag"]
+        if self.validators.get("last_modified"):
+            headers["If-Modified-Since"] = self.validators["last_modified"]
+        async with session.get(
+                self.url,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+        ) as resp:
+            if resp.status == 304:
+                return []
+            if resp.status != 200:
+                raise aiohttp.ClientResponseError(
+                    resp.request_info, resp.history, status=resp.status, message=resp.reason
+                )
+            entries = await handler(resp)
+            self.validators = {
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified")
+            }
+            return entries
+
+    async def fetch(self, session, known):
+        """抓取并解析，known 为已知GUID集合（用于提前结束）"""
+        raise NotImplementedError
+
+
+class SitemapSource(NewsSource):
+    """Google News 站点地图"""
+    kind = "sitemap"
+
+    def __init__(self, name, url, timeout=SOURCE_TIMEOUT):
+        super().__init__(name, url, timeout)
+        # 沿用历史名称的首个站点地图即原 Bloomberg 源，保留其末段GUID规则
+        self.legacy_guid = name == self.kind
+
+    async def fetch(self, session, known):
+        async def _handle(resp):
+            if SITEMAP_STREAMING:
+                return await self._parse_sitemap_stream(resp.content, known)
+            data = await resp.read()
+            with STAGE_SECONDS.time(stage='parse'):
+                return self._parse_sitemap(data)
+
+        return await self._get(session, _handle)
+
+    async def _parse_sitemap_stream(self, content, known):
+        """流式解析站点地图：逐块读取并释放已处理元素，连续遇到已知GUID后提前结束"""
+        xml_parser = ET.XMLPullParser(events=('start', 'end'))
+        root = None
+        entries = []
+        known_run = 0
+        parse_seconds = 0.0  # 只统计解析 CPU 时间，不含网络读取
+        try:
+            async for chunk in content.iter_chunked(SITEMAP_CHUNK_SIZE):
+                started = time.perf_counter()
+                xml_parser.feed(chunk)
+                for event, elem in xml_parser.read_events():
+                    if root is None:
+                        root = elem
+                    if event != 'end' or elem.tag != SITEMAP_URL_TAG:
+                        continue
+
+                    # 先只取 loc 判断是否已知，已知条目不再解析其余字段
+                    loc = elem.findtext(SITEMAP_LOC_TAG)
+                    if loc and self._guid(loc) in known:
+                        known_run += 1
+                    else:
+                        known_run = 0
+                        entry = self._parse_sitemap_entry(elem, SITEMAP_NAMESPACES)
+                        if entry: entries.append(entry)
+                    root.clear()
+
+                    if SITEMAP_KNOWN_RUN and known_run >= SITEMAP_KNOWN_RUN:
+                        break
+                parse_seconds += time.perf_counter() - started
+                if SITEMAP_KNOWN_RUN and known_run >= SITEMAP_KNOWN_RUN:
+                    return entries
+            xml_parser.close()
+        except ET.ParseError as e:
+            print(f"Sitemap解析失败[{self.name}]: {str(e)}")
+        finally:
+            STAGE_SECONDS.observe(parse_seconds, stage='parse')
+        return entries
+
+    def _parse_sitemap(self, xml_data):
+        """解析XML站点地图"""
+        namespaces = SITEMAP_NAMESPACES
+
+        entries = []
+        try:
+            root = ET.fromstring(xml_data)
+            for url in root.findall('ns:url', namespaces):
+                entry = self._parse_sitemap_entry(url, namespaces)
+                if entry: entries.append(entry)
+        except Exception as e:
+            print(f"Sitemap解析失败[{self.name}]: {str(e)}")
+        return entries
+
+    def _parse_sitemap_entry(self, url, namespaces):
+        """解析单个站点地图条目"""
+        try:
+            loc = url.find('ns:loc', namespaces).text
+            news = url.find('news:news', namespaces)
+
+            # 解析元数据
+            pub_date = parse_timestamp(news.find('news:publication_date', namespaces).text)
+            title = news.find('news:title', namespaces).text
+
+            # 股票代码处理
+            stock_elem = news.find('news:stock_tickers', namespaces)
+            stock_tickers = stock_elem.text if stock_elem is not None else ""
+
+            # 图片处理
+            image = url.find('image:image', namespaces)
+            media_url = image.find('image:loc', namespaces).text if image is not None else ""
+
+            return {
+                "guid": self._guid(loc),
+                "title": title,
+                "link": loc,
+                "published": pub_date.isoformat(),
+                "pub_ts": int(pub_date.timestamp()),
+                "stock_tickers": stock_tickers,
+                "media_url": media_url,
+                "source": self.name,
+                "description": ""  # Sitemap无描述字段
+            }
+        except Exception as e:
+            print(f"条目解析异常: {str(e)}")
+            return None
+
+
+class RssSource(NewsSource):
+    """RSS/Atom 订阅源"""
+    kind = "rss"
+
+    async def fetch(self, session, known):
+        async def _handle(resp):
+            data = await resp.read()
+            # feedparser 为纯CPU解析，放到线程池避免阻塞事件循环
+            started = time.perf_counter()
+            feed = await asyncio.get_running_loop().run_in_executor(None, feedparser.parse, data)
+            entries = [self._parse_rss_entry(e) for e in feed.entries]
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage='parse')
+            return entries
+
+        return await self._get(session, _handle)
+
+    def _entry_guid(self, entry):
+        """历史站点上的文章与站点地图同规则；其余优先使用条目自带的 id，缺失时退回规范化地址"""
+        link = entry.get("link")
+        if link and (self.legacy_guid or link_host(link) in self.legacy_hosts):
+            return self._guid(link)
+        return entry.get("id") or guid_from_link(link or '')
+
+    def _parse_rss_entry(self, entry):
+        """解析RSS条目"""
+        try:
+            pub_date = parse_timestamp(entry.published)
+            tags = getattr(entry, "tags", None)
+            stock_tickers = ", ".join(t.term for t in tags) if tags else ""
+            return {
+                "guid": self._entry_guid(entry),
+                "title": entry.title,
+                "description": entry.get("description", ""),
+                "link": entry.link,
+                "published": pub_date.isoformat(),
+                "pub_ts": int(pub_date.timestamp()),
+                "stock_tickers": stock_tickers,
+                "media_url": entry.enclosures[0].href if entry.get("enclosures") else "",
+                "source": self.name
+            }
+        except Exception as e:
+            print(f"RSS条目解析失败: {str(e)}")
+            return None
+
+
+# 可插拔的数据源类型
+SOURCE_TYPES = {
+    SitemapSource.kind: SitemapSource,
+    RssSource.kind: RssSource,
+}
+
+
+class SourceRegistry:
+    """数据源注册表"""
+
+    def __init__(self):
+        self.sources = {}
+        self.legacy_hosts = set()  # 历史站点地图所在站点，各源共享
+
+    def __iter__(self):
+        return iter(self.sources.values())
+
+    def __len__(self):
+        return len(self.sources)
+
+    def register(self, source: NewsSource):
+        source.legacy_hosts = self.legacy_hosts
+        if source.legacy_guid:
+            self.legacy_hosts.add(link_host(source.url))
+        self.sources[source.name] = source
+        return source
+
+    def add(self, kind, url, name=None, **kwargs):
+        """按类型注册数据源；首个同类源沿用历史名称（sitemap / rss）"""
+        if name is None:
+            if any(s.kind == kind for s in self):
+                parsed = urlparse(url)
+                name = f"{kind}:{parsed.netloc}{parsed.path}"
+            else:
+                name = kind
+        return self.register(SOURCE_TYPES[kind](name, url, **kwargs))
+
+    def health(self):
+        return [source.health() for source in self]
+
+    @classmethod
+    def from_env(cls):
+        """从环境变量加载：NEWS_SITEMAPS / NEWS_RSS_FEEDS 为逗号分隔的URL列表"""
+        registry = cls()
+        sitemaps = os.getenv('NEWS_SITEMAPS') or os.getenv('BLOOMBERG_NEWS_SITEMAP') or ''
+        feeds = os.getenv('NEWS_RSS_FEEDS') or os.getenv('BLOOMBERG_RSS_URL') or ''
+        for kind, urls in (("sitemap", sitemaps), ("rss", feeds)):
+            for url in filter(None, (u.strip() for u in urls.split(','))):
+                registry.add(kind, url)
+        return registry
+
+
+def merge_entries(entries):
+    """跨数据源合并去重：同一GUID或同一规范化地址只保留一条，并用其他源补全缺失字段"""
+    merged = {}
+    by_link = {}  # 规范化地址 -> 已保留的条目（GUID规则不同的源指向同一文章）
+    for entry in entries:
+        if not entry:
+            continue
+        if not entry.get("guid"):
+            print(f"条目缺少GUID，已跳过: {entry.get('link', '')}")
+            continue
+        link = normalize_link(entry.get("link") or '')
+        existing = merged.get(entry["guid"]) or (by_link.get(link) if link else None)
+        if existing is None:
+            merged[entry["guid"]] = entry
+            if link:
+                by_link[link] = entry
+            continue
+        for field in ("description", "media_url", "stock_tickers"):
+            if not existing.get(field) and entry.get(field):
+                existing[field] = entry[field]
+    return list(merged.values())
+
+
+class AdaptiveScheduler:
+    """自适应轮询：按历史发布速率确定基准间隔，突发时缩短、空闲时放大"""
+
+    def __init__(self, initial=POLL_INITIAL, floor=POLL_FLOOR, ceiling=POLL_CEILING):
+        self.initial = initial
+        self.floor = floor
+        self.ceiling = ceiling
+        self.intervals = {}  # source name -> 当前间隔
+        self.learned = {}  # source name -> 基准间隔
+        self.learned_at = None
+
+    def _clamp(self, interval):
+        return max(self.floor, min(self.ceiling, interval))
+
+    def interval(self, name):
+        return self.intervals.get(name, self._clamp(self.initial))
+
+    def needs_relearn(self):
+        return self.learned_at is None or time.monotonic() - self.learned_at >= POLL_RELEARN_INTERVAL
+
+    def learn(self, counts, window=POLL_LEARN_WINDOW):
+        """counts: {source name: 窗口内发布条数}"""
+        for name, count in counts.items():
+            gap = window / count if count else self.ceiling
+            self.learned[name] = self._clamp(gap * POLL_GAP_FACTOR)
+        self.learned_at = time.monotonic()
+
+    def observe(self, source, new_count):
+        """根据本轮新增条数调整间隔，下次抓取从本轮开始时间起算"""
+        learned = self.learned.get(source.name, self._clamp(self.initial))
+        interval = self.interval(source.name)
+        if new_count:
+            interval = min(interval, learned) * POLL_BURST_FACTOR
+        else:
+            interval = min(interval * POLL_QUIET_FACTOR, learned * POLL_QUIET_CAP)
+        interval = self._clamp(interval)
+        self.intervals[source.name] = interval
+        if not source.failures:
+            source.next_run = source.started_at + interval
+
+
+class IngestEngine:
+    """多数据源并发抓取：有界并发，单源超时/退避，慢源结果并入下一轮"""
+
+    def __init__(self, registry: SourceRegistry, scheduler: AdaptiveScheduler,
+                 max_concurrency=SOURCE_CONCURRENCY, cycle_deadline=INGEST_CYCLE_DEADLINE,
+                 force_min_interval=FORCE_MIN_INTERVAL):
+        self.registry = registry
+        self.scheduler = scheduler
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.cycle_deadline = cycle_deadline
+        self.force_min_interval = force_min_interval
+        self.last_forced = None  # 上次强制抓取的 time.monotonic()
+        self.inflight = {}  # source name -> task
+
+    async def _run(self, source, session, known):
+        async with self.semaphore:
+            started = time.perf_counter()
+            try:
+                entries = await asyncio.wait_for(source.fetch(session, known), source.timeout)
+            except Exception as e:
+                SOURCE_ERRORS.inc(source=source.name)
+                source.record_failure(e)
+                print(f"数据源抓取失败[{source.name}]: {source.last_error}")
+                return []
+            SOURCE_FETCH_SECONDS.observe(time.perf_counter() - started, source=source.name)
+            ARTICLES_TOTAL.inc(len(entries), stage='fetched')
+            source.record_success(len(entries))
+            return entries
+
+    async def collect(self, session, known, force=False):
+        """启动到期的数据源并收集本轮完成的结果，返回 (合并去重后的条目, 完成的数据源)
+
+        force=True 时提前抓取未到期的源，但仍遵守失败退避，且全局间隔不足时按普通轮次处理
+        """
+        now = time.monotonic()
+        if force:
+            if self.last_forced is not None and now - self.last_forced < self.force_min_interval:
+                force = False
+            else:
+                self.last_forced = now
+        started = []
+        for source in self.registry:
+            # 失败退避中的源即使强制也不提前抓取，避免覆盖退避时间
+            due = source.is_due(now) or (force and not source.failures)
+            if source.name not in self.inflight and due:
+                source.started_at = now
+                source.next_run = now + self.scheduler.interval(source.name)
+                task = asyncio.create_task(self._run(source, session, known))
+                self.inflight[source.name] = task
+                started.append(task)
+
+        # 只等待本轮新启动的源；上一轮遗留的慢源完成了就顺带收集
+        if started:
+            await asyncio.wait(started, timeout=self.cycle_deadline)
+        entries = []
+        finished = []
+        for name, task in list(self.inflight.items()):
+            if task.done():
+                del self.inflight[name]
+                entries.extend(task.result())
+                finished.append(self.registry.sources[name])
+        return merge_entries(entries), finished
+
+    def next_delay(self):
+        """距离下一个数据源到期的秒数；有慢源在途时按本轮截止时间再检查"""
+        now = time.monotonic()
+        due = [s.next_run for s in self.registry if s.name not in self.inflight]
+        if self.inflight:
+            due.append(now + self.cycle_deadline)
+        if not due:
+            return self.scheduler.initial
+        return max(1.0, min(due) - now)
+
+    def cancel(self):
+        for task in self.inflight.values():
+            task.cancel()
+        self.inflight.clear()
@@ -0,0 +1,22 @@
+"""令牌桶限速：服务器端客户端限流与 Telegram 推送限速共用"""
+import time
+
+
+class TokenBucket:
+    """令牌桶：rate 为每秒补充令牌数，burst 为桶容量"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost=1):
+        """取 cost 个令牌，成功返回 0，否则返回需等待的秒数"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0
+        return (cost - self.tokens) / self.rate
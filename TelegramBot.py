@@ -4,6 +4,8 @@ import os
 import json
 import asyncio
 import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
 # from pyexpat.errors import messages
 
 import aiohttp
@@ -11,6 +13,10 @@ import websockets
 from typing import Optional
 import dotenv
 import DatabaseManager as db
+from Metrics import REGISTRY, STAGE_SECONDS, start_metrics_server
+from RateLimit import TokenBucket
+from TranslationCache import TranslationCache, translation_key
+from WireFormats import available_subprotocols, loads
 
 dotenv.load_dotenv()
 # dbConn = db.DatabaseManager()
@@ -20,20 +26,173 @@ TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
 WEBSOCKET_URI = os.getenv('WEBSOCKET_URI')
 DIFY_API_KEY = os.getenv('DIFY_API_KEY')
 DIFY_ENDPOINT = os.getenv('DIFY_ENDPOINT')
+DIFY_BATCH_API_KEY = os.getenv('DIFY_BATCH_API_KEY')  # dify/translator-batch-dify.yml 的密钥，设置后启用批量翻译
 RECONNECT_DELAY = 10
-RATE_LIMIT = 1.2  # 严格遵循Telegram的速率限制
+RESUME_RETRY_DELAY = 1  # 补发请求被拒且未给出 retry_after 时的重试间隔（秒）
+RATE_LIMIT = 1.2  # 同一聊天两条消息的最小间隔（秒），严格遵循Telegram的速率限制
+TELEGRAM_CHAT_BURST = int(os.getenv('TELEGRAM_CHAT_BURST', 1))  # 每个聊天允许的突发条数
+TELEGRAM_GLOBAL_RATE = int(os.getenv('TELEGRAM_GLOBAL_RATE', 30))  # Bot API 全局每秒消息数
+MAX_FLOOD_WAITS = 5  # 单条消息最多等待 429 retry_after 的次数
+DIGEST_MAX_LAG = float(os.getenv('DIGEST_MAX_LAG', 60))  # 文章收到后超过该秒数仍未发出时合并为摘要（0 为关闭）
+DIGEST_MAX_ARTICLES = int(os.getenv('DIGEST_MAX_ARTICLES', 10))  # 每条摘要最多包含的文章数
+TELEGRAM_TEXT_LIMIT = 4096
+MEDIA_CACHE_SIZE = 1000  # 记住的图片地址数（校验结果与 file_id）
+MEDIA_VALID_TTL = 6 * 3600  # 图片可用结果的有效期（秒）
+MEDIA_INVALID_TTL = 600  # 图片不可用结果的有效期（秒），到期后重新校验
+METRICS_HOST = os.getenv('METRICS_HOST', 'localhost')
+BOT_METRICS_PORT = int(os.getenv('BOT_METRICS_PORT', 9101))  # Prometheus 指标端口（0 为关闭）
+TRANSLATE_TARGET_LANG = os.getenv('TRANSLATE_TARGET_LANG', 'zh')  # 翻译工作流的目标语言，参与缓存键
+TRANSLATION_CACHE_DB = os.getenv('TRANSLATION_CACHE_DB', 'translations.db')  # 译文持久化缓存（空为仅内存）
+TRANSLATE_CONCURRENCY = int(os.getenv('TRANSLATE_CONCURRENCY', 4))  # 同时进行的翻译请求数
+TRANSLATE_BATCH_SIZE = int(os.getenv('TRANSLATE_BATCH_SIZE', 10))  # 每次批量翻译的最大篇数
+TRANSLATE_BATCH_WINDOW = 0.05  # 凑批等待时间（秒）
+TRANSLATE_TIMEOUT = 30  # 单篇翻译超时（秒）
+TRANSLATE_BATCH_TIMEOUT = 90  # 批量翻译超时（秒）
+TRANSLATE_AHEAD = int(os.getenv('TRANSLATE_AHEAD', 20))  # 翻译最多领先发送的文章数
+
+# 指标
+ARTICLES_RECEIVED = REGISTRY.counter('bot_articles_received_total', '收到的待推送文章数', ('kind',))
+PIPELINE_PENDING = REGISTRY.gauge('bot_pipeline_pending', '已接收但尚未发送的文章数')
+TELEGRAM_MESSAGES = REGISTRY.counter('telegram_messages_total', 'Telegram 推送结果', ('result',))
+TELEGRAM_HTTP_ERRORS = REGISTRY.counter('telegram_http_errors_total', 'Telegram API 错误次数', ('method',))
+TELEGRAM_FLOOD_WAITS = REGISTRY.counter('telegram_flood_waits_total', '收到 429 并按 retry_after 等待的次数')
+MEDIA_LOOKUPS = REGISTRY.counter(
+    'telegram_media_lookups_total', '图片处理方式（file_id/cached/checked/unavailable）', ('result',)
+)
+DIGEST_ARTICLES = REGISTRY.counter('telegram_digest_articles_total', '以摘要形式合并推送的文章数')
+TRANSLATE_ERRORS = REGISTRY.counter('translate_errors_total', '翻译失败次数')
+TRANSLATE_REQUESTS = REGISTRY.counter('translate_requests_total', 'Dify 工作流调用次数', ('mode',))
+TRANSLATE_FALLBACKS = REGISTRY.counter('translate_batch_fallbacks_total', '批量结果无效而改为单篇翻译的条目数')
+DELIVERY_LATENCY = REGISTRY.histogram(
+    'news_publish_latency_seconds', '从文章发布时间到各阶段的延迟（秒）', ('stage',)
+)
+
+
+class TelegramRetryAfter(Exception):
+    """Telegram 返回 429，retry_after 为要求等待的秒数"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+async def _raise_for_flood(resp, method):
+    """429 时解析 parameters.retry_after 并抛出 TelegramRetryAfter"""
+    if resp.status != 429:
+        return
+    TELEGRAM_HTTP_ERRORS.inc(method=method)
+    try:
+        retry_after = (await resp.json(content_type=None)).get('parameters', {}).get('retry_after')
+    except (ValueError, aiohttp.ClientError):
+        retry_after = None
+    raise TelegramRetryAfter(float(retry_after or RATE_LIMIT))
+
+
+class TelegramRateLimiter:
+    """全局令牌桶 + 每个聊天一个令牌桶；收到 429 后在 retry_after 内暂停所有发送"""
+
+    def __init__(self, global_rate=TELEGRAM_GLOBAL_RATE, chat_interval=RATE_LIMIT,
+                 chat_burst=TELEGRAM_CHAT_BURST):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = 1 / chat_interval
+        self.chat_burst = chat_burst
+        self.chat_buckets = {}  # chat_id -> TokenBucket
+        self.paused_until = 0.0
+
+    async def acquire(self, chat_id):
+        """等待直到该聊天与全局都有可用令牌"""
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        for current in (bucket, self.global_bucket):
+            while True:
+                paused = self.paused_until - time.monotonic()
+                if paused > 0:
+                    await asyncio.sleep(paused)
+                    continue
+                wait = current.take()
+                if not wait:
+                    break
+                await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class MediaCache:
+    """图片地址缓存：HEAD/Range 校验结果按 TTL 保留，发送成功后记住 Telegram 返回的 file_id
+
+    已有 file_id 的图片直接按 file_id 发送，无需再次校验或让 Telegram 重新下载。
+    """
+
+    def __init__(self, size=MEDIA_CACHE_SIZE, valid_ttl=MEDIA_VALID_TTL, invalid_ttl=MEDIA_INVALID_TTL):
+        self.size = size
+        self.valid_ttl = valid_ttl
+        self.invalid_ttl = invalid_ttl
+        self._checked = OrderedDict()  # url -> (expires_at, valid)
+        self._file_ids = OrderedDict()  # url -> file_id
+
+    @staticmethod
+    def _touch(entries, key, value, size):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > size:
+            entries.popitem(last=False)
+
+    def file_id(self, url):
+        file_id = self._file_ids.get(url)
+        if file_id is not None:
+            self._file_ids.move_to_end(url)
+        return file_id
+
+    def remember_file_id(self, url, file_id):
+        self._touch(self._file_ids, url, file_id, self.size)
+
+    def forget_file_id(self, url):
+        self._file_ids.pop(url, None)
+
+    def mark(self, url, valid):
+        ttl = self.valid_ttl if valid else self.invalid_ttl
+        self._touch(self._checked, url, (time.monotonic() + ttl, valid), self.size)
+
+    def cached(self, url):
+        """未过期的校验结果，无记录或已过期返回 None"""
+        entry = self._checked.get(url)
+        if entry is None:
+            return None
+        expires_at, valid = entry
+        if expires_at <= time.monotonic():
+            del self._checked[url]
+            return None
+        self._checked.move_to_end(url)
+        return valid
+
+    async def validate(self, session, url):
+        """校验图片可访问：先发 HEAD，不支持时退回只取 1 字节的 Range GET"""
+        valid = self.cached(url)
+        if valid is not None:
+            MEDIA_LOOKUPS.inc(result='cached' if valid else 'unavailable')
+            return valid
+        try:
+            async with session.head(url, timeout=10, allow_redirects=True) as resp:
+                status = resp.status
+            if status in (403, 405, 501):  # 部分 CDN 不支持 HEAD
+                async with session.get(url, timeout=10, headers={'Range': 'bytes=0-0'}) as resp:
+                    status = resp.status
+            valid = status in (200, 206)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            valid = False
+        self.mark(url, valid)
+        MEDIA_LOOKUPS.inc(result='checked' if valid else 'unavailable')
+        return valid
 
 
 class EnhancedTelegramBot:
     def __init__(self):
         self.session = aiohttp.ClientSession()
-        self.last_sent = time.monotonic()
-        self.semaphore = asyncio.Semaphore(5)  # 并发控制
         self.retry_limit = 3
-        self.rate_limiter = asyncio.Queue()
-        self.send_lock = asyncio.Lock()
-        for _ in range(5):  # 初始化速率限制令牌
-            self.rate_limiter.put_nowait(None)
+        self.limiter = TelegramRateLimiter()
+        self.media = MediaCache()
 
     async def _escape_markdown(self, text: str) -> str:
         """优化后的MarkdownV2转义方法"""
@@ -44,32 +203,54 @@ class EnhancedTelegramBot:
         return text.translate(str.maketrans({c: f'\\{c}' for c in escape_chars}))
 
     async def _send_photo_message(self, url: str, caption: str) -> bool:
-        """使用FormData发送带图片的消息"""
+        """使用FormData发送带图片的消息，已发送过的图片复用 file_id"""
         try:
-            # 验证图片URL有效性
-            async with self.session.get(url, timeout=10) as resp:
-                if resp.status != 200:
-                    print(f"图片资源不可用: {url}")
-                    return False
+            file_id = self.media.file_id(url)
+            if file_id is not None:
+                MEDIA_LOOKUPS.inc(result='file_id')
+            elif not await self.media.validate(self.session, url):
+                # 验证图片URL有效性（结果缓存，重试时不再重复校验）
+                TELEGRAM_HTTP_ERRORS.inc(method='media_check')
+                print(f"图片资源不可用: {url}")
+                return False
 
+            await self.limiter.acquire(TELEGRAM_CHAT_ID)
             photo_url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendPhoto"
             form = aiohttp.FormData()
             form.add_field('chat_id', TELEGRAM_CHAT_ID)
-            form.add_field('photo', url)
+            form.add_field('photo', file_id or url)
             form.add_field('caption', await self._escape_markdown(caption[:1024]))
             form.add_field('parse_mode', "MarkdownV2")
             form.add_field('disable_web_page_preview', "true")
             async with self.session.post(photo_url, data=form) as resp:
                 if resp.status == 200:
+                    await self._remember_photo(url, resp)
                     return True
+                await _raise_for_flood(resp, 'sendPhoto')
+                TELEGRAM_HTTP_ERRORS.inc(method='sendPhoto')
+                if resp.status == 400:
+                    # file_id 失效则下次改用地址；地址本身被 Telegram 拒绝则在 TTL 内不再尝试
+                    if file_id is not None:
+                        self.media.forget_file_id(url)
+                    else:
+                        self.media.mark(url, False)
                 error = await resp.text()
                 print(f"图片地址: {url}")
                 print(f"Telegram图片发送失败[{resp.status}]: {error}")
                 return False
         except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            TELEGRAM_HTTP_ERRORS.inc(method='sendPhoto')
             print(f"图片发送网络错误: {str(e)}")
             return False
 
+    async def _remember_photo(self, url: str, resp):
+        """记录 sendPhoto 返回的最大尺寸图片 file_id（解析失败不影响发送结果）"""
+        try:
+            photos = (await resp.json(content_type=None))['result']['photo']
+            self.media.remember_file_id(url, photos[-1]['file_id'])
+        except (ValueError, aiohttp.ClientError, KeyError, IndexError, TypeError):
+            pass
+
     async def _send_text_message(self, message: str) -> bool:
         """发送纯文本消息，增强错误处理"""
         text_url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
@@ -81,13 +262,17 @@ class EnhancedTelegramBot:
         }
 
         try:
+            await self.limiter.acquire(TELEGRAM_CHAT_ID)
             async with self.session.post(text_url, json=payload, timeout=10) as resp:
                 if resp.status == 200:
                     return True
+                await _raise_for_flood(resp, 'sendMessage')
+                TELEGRAM_HTTP_ERRORS.inc(method='sendMessage')
                 error = await resp.text()
                 print(f"Telegram文本发送失败[{resp.status}]: {error}")
                 return False
         except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            TELEGRAM_HTTP_ERRORS.inc(method='sendMessage')
             print(f"文本发送网络错误: {str(e)}")
             return False
 
@@ -138,54 +323,149 @@ class EnhancedTelegramBot:
             print(f"[ERROR] 消息构建异常: {str(e)}")
             return f"{raw_title}\n\n[阅读全文]({article.get('link', '#')})"
 
+    async def _construct_digest(self, articles: list) -> list:
+        """将多篇文章合并为摘要消息（按 Telegram 长度上限拆分为多条）"""
+        header = f"*{_escape_markdown_v2(f'新闻摘要（{len(articles)} 条）')}*"
+        messages, lines = [], [header]
+        length = len(header)
+        for article in articles:
+            title = html.unescape(article.get('translated_title', '') or article.get('title', '') or 'Untitled')
+            line = f"• {_escape_markdown_v2(title)} [↗]({_escape_link(article.get('link', '#'))})"
+            tickers = str(article.get('stock_tickers', '') or '')
+            if tickers:
+                line += f" `{_escape_markdown_v2(tickers)}`"
+            if length + len(line) + 2 > TELEGRAM_TEXT_LIMIT and len(lines) > 1:
+                messages.append("\n\n".join(lines))
+                lines, length = [header], len(header)
+            lines.append(line)
+            length += len(line) + 2
+        messages.append("\n\n".join(lines))
+        return messages
+
+    async def _deliver(self, message: str, media_url: str = '') -> bool:
+        """发送一条消息：图片优先、纯文本回退；429 按 retry_after 等待且不计入重试次数"""
+        started = time.perf_counter()
+        attempt = flood_waits = 0
+        try:
+            while attempt < self.retry_limit:
+                try:
+                    # 优先发送带图片的消息
+                    if media_url:
+                        if await self._send_photo_message(media_url, message):
+                            return True
+                        print("图片发送失败，尝试纯文本方式...")
+
+                    # 纯文本回退
+                    if await self._send_text_message(message):
+                        return True
+                except TelegramRetryAfter as e:
+                    TELEGRAM_FLOOD_WAITS.inc()
+                    flood_waits += 1
+                    if flood_waits > MAX_FLOOD_WAITS:
+                        print(f"消息发送失败，限流等待已达上限: {MAX_FLOOD_WAITS}")
+                        return False
+                    print(f"触发Telegram限流，{e.retry_after}秒后重试...")
+                    self.limiter.pause(e.retry_after)
+                    continue
+                except Exception as e:
+                    print(f"发送尝试 {attempt + 1} 失败: {str(e)}")
+                    await asyncio.sleep(2 ** attempt)
+                attempt += 1
+            print(f"消息发送失败，已达最大重试次数: {self.retry_limit}")
+            return False
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage='telegram_send')
+
     async def send_article(self, article: dict):
         """增强的消息发送方法，包含速率控制和重试机制"""
-        async with self.send_lock:
+        message = await self._construct_message(article)
+        message_sent = await self._deliver(message, article.get('media_url', ''))
+        TELEGRAM_MESSAGES.inc(result='ok' if message_sent else 'failed')
+        if message_sent:
+            _observe_delivery(article)
 
-            async with self.semaphore:
-                await self.rate_limiter.get()  # 等待可用令牌
-                try:
-                    message_sent = False
-                    for attempt in range(self.retry_limit):
-                        if message_sent:
-                            break
-                        try:
-                            # 速率控制
-                            now = time.monotonic()
-                            if now - self.last_sent < RATE_LIMIT:
-                                await asyncio.sleep(RATE_LIMIT - (now - self.last_sent))
-
-                            message = await self._construct_message(article)
-                            media_url = article.get('media_url', '')
-
-                            # 优先发送带图片的消息
-                            success = False
-                            if media_url:
-                                message_sent = await self._send_photo_message(media_url, message)
-                                if message_sent:
-                                    break
-                                print("图片发送失败，尝试纯文本方式...")
-
-                            # 纯文本回退
-                            message_sent = await self._send_text_message(message)
-                            if message_sent:
-                                break
-                        except Exception as e:
-                            print(f"发送尝试 {attempt + 1} 失败: {str(e)}")
-                            await asyncio.sleep(2 ** attempt)
+    async def send_digest(self, articles: list):
+        """积压时将多篇文章合并为一条（或少数几条）摘要消息发送"""
+        DIGEST_ARTICLES.inc(len(articles))
+        message_sent = True
+        for message in await self._construct_digest(articles):
+            sent = await self._deliver(message)
+            TELEGRAM_MESSAGES.inc(result='ok' if sent else 'failed')
+            message_sent = message_sent and sent
+        if message_sent:
+            for article in articles:
+                _observe_delivery(article)
 
-                    else:
-                        print(f"消息发送失败，已达最大重试次数: {self.retry_limit}")
-                finally:
-                    self.last_sent = time.monotonic()
-                    self.rate_limiter.put_nowait(None)  # 释放令牌
+
+def _escape_markdown_v2(text: str) -> str:
+    """完整的 MarkdownV2 转义（摘要中的标题原样显示，不含格式）"""
+    return ''.join(f'\\{c}' if c in '_*[]()~`>#+-=|{}.!\\' else c for c in text)
+
+
+def _escape_link(url: str) -> str:
+    """MarkdownV2 链接地址中只需转义 ) 与 \\"""
+    return url.replace('\\', '\\\\').replace(')', '\\)')
+
+
+def _observe_delivery(article):
+    """记录文章从发布时间到送达 Telegram 的延迟"""
+    try:
+        published = db.to_epoch(article['published'])
+    except (KeyError, TypeError, ValueError):
+        return
+    DELIVERY_LATENCY.observe(max(0.0, time.time() - published), stage='delivered')
+
+
+def parse_batch_translations(raw, count):
+    """解析批量工作流输出为与输入对齐的列表，缺失或格式错误的条目为 None
+
+    输出可以是 JSON 数组，或包含 translations 数组的对象（允许包裹在 ``` 代码块中）。
+    """
+    results = [None] * count
+    if isinstance(raw, str):
+        text = raw.strip()
+        if text.startswith('```'):
+            text = text.strip('`')
+            text = text[text.find('\n') + 1:] if '\n' in text else ''
+        try:
+            raw = json.loads(text)
+        except ValueError:
+            return results
+    if isinstance(raw, dict):
+        raw = raw.get('translations')
+    if not isinstance(raw, list):
+        return results
+    for position, item in enumerate(raw):
+        if not isinstance(item, dict):
+            continue
+        index = item.get('id', position)
+        try:
+            index = int(index)
+        except (TypeError, ValueError):
+            continue
+        title = item.get('title')
+        description = item.get('description') or ''
+        if 0 <= index < count and isinstance(title, str) and title.strip() and isinstance(description, str):
+            results[index] = {'title': title, 'description': description}
+    return results
 
 
 class NewsTranslator:
-    def __init__(self, api_key: str, endpoint: str):
+    def __init__(self, api_key: str, endpoint: str, cache: Optional[TranslationCache] = None,
+                 lang: str = TRANSLATE_TARGET_LANG, batch_api_key: Optional[str] = None,
+                 batch_size: int = TRANSLATE_BATCH_SIZE, concurrency: int = TRANSLATE_CONCURRENCY):
         self.api_key = api_key
         self.endpoint = endpoint
+        self.cache = cache
+        self.lang = lang
+        self.batch_api_key = batch_api_key  # 批量翻译工作流的密钥，为空时逐篇翻译
+        self.batch_size = batch_size
         self.session: Optional[aiohttp.ClientSession] = None
+        self.request_slots = asyncio.Semaphore(concurrency)  # 同时进行的工作流请求数
+        self._inflight = {}  # 缓存键 -> 进行中的翻译任务，并发流水线中相同原文只请求一次
+        self._batch = []  # 等待合并的 (title, description, future)
+        self._batch_timer = None
+        self._batch_tasks = set()
 
     async def _ensure_session(self):
         """按需创建会话"""
@@ -196,66 +476,198 @@ class NewsTranslator:
         """安全关闭会话"""
         if self.session and not self.session.closed:
             await self.session.close()
+        if self.cache:
+            self.cache.close()
 
     async def translate_news(self, title: str, description: str) -> dict:
+        """先查翻译缓存，未命中再调用 Dify，成功结果写回缓存"""
+        if self.cache is None:
+            return await self._translate_uncached(title, description)
+        key = translation_key(title, description, self.lang)
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+        task = asyncio.ensure_future(self._translate_cached(key, title, description))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _translate_cached(self, key, title, description):
+        cached = await self.cache.get(key)
+        if cached is not None:
+            print(f"[Translator] 命中翻译缓存: {title[:30]}...")
+            return cached
+        outputs = await self._translate_uncached(title, description)
+        if outputs:
+            await self.cache.put(key, self.lang, outputs)
+        return outputs
+
+    async def _translate_uncached(self, title, description):
+        if not self.batch_api_key:
+            return await self._request_translation(title, description)
+        future = asyncio.get_running_loop().create_future()
+        self._batch.append((title, description, future))
+        if len(self._batch) >= self.batch_size:
+            self._flush_batch()
+        elif self._batch_timer is None:
+            # 短暂等待同一批突发中的其他文章，凑满一批或到时即发送
+            self._batch_timer = asyncio.get_running_loop().call_later(
+                TRANSLATE_BATCH_WINDOW, self._flush_batch
+            )
+        return await future
+
+    def _flush_batch(self):
+        if self._batch_timer is not None:
+            self._batch_timer.cancel()
+            self._batch_timer = None
+        batch, self._batch = self._batch, []
+        if batch:
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, batch):
+        """一次工作流调用翻译整批；缺失或格式错误的条目回退为单篇翻译"""
+        try:
+            if len(batch) == 1:
+                results = [await self._request_translation(batch[0][0], batch[0][1])]
+            else:
+                results = await self._request_batch([(title, description) for title, description, _ in batch])
+            fallbacks = [i for i, outputs in enumerate(results) if outputs is None]
+            if fallbacks:
+                TRANSLATE_FALLBACKS.inc(len(fallbacks))
+                print(f"[Translator] 批量结果中 {len(fallbacks)} 条无效，改为单篇翻译")
+                retried = await asyncio.gather(
+                    *(self._request_translation(batch[i][0], batch[i][1]) for i in fallbacks)
+                )
+                for i, outputs in zip(fallbacks, retried):
+                    results[i] = outputs
+        except Exception as e:
+            print(f"[ERROR] 批量翻译异常: {str(e)}")
+            results = [{}] * len(batch)
+        for (_, _, future), outputs in zip(batch, results):
+            if not future.done():
+                future.set_result(outputs or {})
+
+    async def _request_batch(self, items):
+        """调用批量工作流，返回与 items 对齐的结果列表（无效条目为 None）"""
+        print(f"[Translator] 批量翻译 {len(items)} 篇...")
+        payload = [
+            {"id": i, "title": title, "description": description}
+            for i, (title, description) in enumerate(items)
+        ]
+        outputs = await self._run_workflow(
+            self.batch_api_key,
+            {"items": json.dumps(payload, ensure_ascii=False)},
+            mode='batch'
+        )
+        return parse_batch_translations(outputs.get('translations'), len(items))
+
+    async def _request_translation(self, title: str, description: str) -> dict:
         """增强的翻译方法，包含超时控制"""
-        await self._ensure_session()
         print(f"[Translator] 开始翻译: {title[:50]}...")
+        outputs = await self._run_workflow(
+            self.api_key,
+            {"title": title, "description": description},
+            mode='single'
+        )
+        if outputs:
+            print(f"[Translator] 成功翻译: {title[:30]}...")
+        return outputs
+
+    async def _run_workflow(self, api_key: str, inputs: dict, mode: str) -> dict:
+        """以 blocking 模式运行 Dify 工作流，失败返回空字典"""
+        await self._ensure_session()
 
         headers = {
-            "Authorization": f"Bearer {self.api_key}",
+            "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
         }
         payload = {
-            "inputs": {
-                "title": title,
-                "description": description
-            },
+            "inputs": inputs,
             "response_mode": "blocking",
             "user": "bloomberg-news"
         }
 
-        try:
-            async with self.session.post(
-                    self.endpoint,
-                    headers=headers,
-                    json=payload,
-                    timeout=30
-            ) as resp:
-                if resp.status != 200:
-                    error = await resp.text()
-                    print(f"[ERROR] Dify API响应异常: {resp.status} - {error}")
-                    return {}
-                print("[Translator] 正在解析JSON响应...")
-                result = await resp.json()
-                if not result.get('data', {}).get('outputs'):
-                    print(f"[WARN] 无效的翻译结果: {json.dumps(result, indent=2)}")
-                    return {}
-                print(f"[Translator] 成功翻译: {title[:30]}...")
-                return result['data']['outputs']
-        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-            print(f"[ERROR] 翻译请求失败: {str(e)}")
-            return {}
-        except json.JSONDecodeError:
-            print("[ERROR] 无效的JSON响应")
-            return {}
+        async with self.request_slots:
+            TRANSLATE_REQUESTS.inc(mode=mode)
+            started = time.perf_counter()
+            try:
+                async with self.session.post(
+                        self.endpoint,
+                        headers=headers,
+                        json=payload,
+                        timeout=TRANSLATE_TIMEOUT if mode == 'single' else TRANSLATE_BATCH_TIMEOUT
+                ) as resp:
+                    if resp.status != 200:
+                        TRANSLATE_ERRORS.inc()
+                        error = await resp.text()
+                        print(f"[ERROR] Dify API响应异常: {resp.status} - {error}")
+                        return {}
+                    print("[Translator] 正在解析JSON响应...")
+                    result = await resp.json()
+                    if not result.get('data', {}).get('outputs'):
+                        TRANSLATE_ERRORS.inc()
+                        print(f"[WARN] 无效的翻译结果: {json.dumps(result, indent=2)}")
+                        return {}
+                    return result['data']['outputs']
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                TRANSLATE_ERRORS.inc()
+                print(f"[ERROR] 翻译请求失败: {str(e)}")
+                return {}
+            except json.JSONDecodeError:
+                TRANSLATE_ERRORS.inc()
+                print("[ERROR] 无效的JSON响应")
+                return {}
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage='translate')
+
+
+def _with_translation(article: dict, translated: Optional[dict]) -> dict:
+    processed = article.copy()
+    if translated:
+        processed.update({
+            'translated_title': translated.get('title', ''),
+            'translated_description': translated.get('description', '')
+        })
+    return processed
 
 
 class RobustWSClient:
     def __init__(self):
         self.bot = EnhancedTelegramBot()
-        self.translator = NewsTranslator(DIFY_API_KEY, DIFY_ENDPOINT)
+        self.translator = NewsTranslator(
+            DIFY_API_KEY, DIFY_ENDPOINT,
+            cache=TranslationCache(TRANSLATION_CACHE_DB),
+            batch_api_key=DIFY_BATCH_API_KEY
+        )
         self.reconnect_count = 0
+        self.last_seq = None  # 已接收的最大序列号，重连时据此补发
+        self.resume_retry = None  # 被限流的补发请求的重试任务
+        # 翻译-发送流水线：翻译并发提前进行（并发数由翻译器限制），交接队列按接收顺序交给唯一的发送协程
+        self.handoff = asyncio.Queue(maxsize=TRANSLATE_AHEAD)
+        self.sender = None
+        PIPELINE_PENDING.func = lambda: self.handoff.qsize()
+
+    def _connect_uri(self):
+        """重连时附带 last_seq，服务器只补发错过的文章"""
+        if self.last_seq is None:
+            return WEBSOCKET_URI
+        parts = urlparse(WEBSOCKET_URI)
+        query = [(k, v) for k, v in parse_qsl(parts.query) if k != 'last_seq']
+        query.append(('last_seq', str(self.last_seq)))
+        return urlunparse(parts._replace(query=urlencode(query)))
 
     async def _safe_connect(self):
         """带指数退避的WebSocket连接"""
         while True:
             try:
                 return await websockets.connect(
-                    WEBSOCKET_URI,
+                    self._connect_uri(),
                     ping_interval=20,
                     ping_timeout=20,
-                    max_size=2 ** 20  # 1MB
+                    max_size=2 ** 20,  # 1MB
+                    subprotocols=available_subprotocols()  # 已安装 msgpack 时协商二进制帧
                 )
             except Exception as e:
                 delay = min(RECONNECT_DELAY * (2 ** self.reconnect_count), 300)
@@ -268,13 +680,34 @@ class RobustWSClient:
         try:
             async for message in ws:
                 try:
-                    data = json.loads(message)
+                    data = loads(message)
+                    if data.get('type') in ('update', 'resume'):
+                        ARTICLES_RECEIVED.inc(len(data.get('articles', [])), kind=data['type'])
                     if data.get('type') == 'update':
                         await self._process_update(data.get('articles', []))
+                        self._advance_seq(data.get('last_seq'))
+                    elif data.get('type') == 'resume':
+                        print(f"补发 {len(data.get('articles', []))} 条错过的文章")
+                        await self._process_update(data.get('articles', []))
+                        self._advance_seq(data.get('last_seq'))
+                        if data.get('has_more'):
+                            await self._request_resume(ws)
+                    elif data.get('type') == 'resync':
+                        # 服务器因发送积压丢弃了部分更新，从已接收的位置补发
+                        print(f"服务器要求重新同步: {data.get('reason', '')}")
+                        await self._request_resume(ws)
+                    elif data.get('type') == 'error':
+                        print(f"[WARN] 服务器返回错误: {data.get('message')} ({data.get('action')})")
+                        if data.get('action') == 'resume':
+                            # 补发请求被限流或服务器繁忙，稍后重试
+                            self._schedule_resume(ws, data.get('retry_after') or RESUME_RETRY_DELAY)
                     elif data.get('type') == 'history':
                         print(f"收到历史数据，共{len(data.get('articles', []))}条")
-                except json.JSONDecodeError:
-                    print("[ERROR] 无效的JSON消息")
+                        # 首次连接：以当前最新序列号为起点，不重复推送历史
+                        if self.last_seq is None:
+                            self.last_seq = data.get('last_seq')
+                except ValueError:
+                    print("[ERROR] 无效的消息格式")
                 except KeyError as e:
                     print(f"[ERROR] 消息格式错误，缺少字段: {str(e)}")
                 except Exception as e:
@@ -283,44 +716,84 @@ class RobustWSClient:
             print(f"连接关闭: {e.code} {e.reason}")
             raise
 
-    async def _process_update(self, articles):
-        """增加超时控制的处理逻辑"""
-        print(f"\n[Processing] 收到 {len(articles)} 篇新文章")
-        # 新增处理队列
-        processing_queue = asyncio.Queue()
-        for article in articles:
-                #processing_queue.put_nowait(article)
-                await processing_queue.put(article)
-        while not processing_queue.empty():
-            article = await processing_queue.get()
+    async def _request_resume(self, ws):
+        """请求补发 last_seq 之后的文章（尚未收到任何序列号时由重连的历史页确定起点）"""
+        if self.last_seq is None:
+            return
+        await ws.send(json.dumps({"action": "resume", "last_seq": self.last_seq}))
+
+    def _schedule_resume(self, ws, delay):
+        if self.resume_retry is not None and not self.resume_retry.done():
+            return
+
+        async def _retry():
+            await asyncio.sleep(delay)
             try:
-                await self._process_single_article(article)
-            finally:
-                processing_queue.task_done()
+                await self._request_resume(ws)
+            except websockets.ConnectionClosed:
+                pass  # 重连时会带上 last_seq 补发
 
-    async def _process_single_article(self, article: dict):
-        """原子化处理单篇文章"""
+        self.resume_retry = asyncio.create_task(_retry())
 
+    def _advance_seq(self, seq):
+        if seq is not None and (self.last_seq is None or seq > self.last_seq):
+            self.last_seq = seq
 
+    async def _process_update(self, articles):
+        """为每篇文章提前启动翻译，并按原顺序放入交接队列
 
+        交接队列有界：发送落后 TRANSLATE_AHEAD 篇时在此等待，形成背压。
+        """
+        print(f"\n[Processing] 收到 {len(articles)} 篇新文章")
+        received = time.monotonic()  # 在背压等待之前取时间，发送延迟从收到时算起
+        for article in articles:
+            translation = asyncio.create_task(self._translate(article))
+            await self.handoff.put((article, translation, received))
 
-        # 阶段1: 获取翻译结果
+    async def _translate(self, article: dict):
+        """阶段1: 获取翻译结果"""
         try:
-            translated = await self.translator.translate_news(
+            return await self.translator.translate_news(
                 article.get('title', ''),
                 article.get('description', '')
             )
         except Exception as e:
-            translated = None
             print(f"[ERROR] 翻译失败: {str(e)}")
+            return None
+
+    async def _send_loop(self):
+        """唯一的发送协程：按接收顺序等待各自的翻译结果并推送
 
+        队首文章收到后已超过 DIGEST_MAX_LAG 秒仍未发出（真实的发送滞后，
+        而不是仍在翻译中的队列长度）且后面还有积压时，把队首连续的多篇
+        合并为一条摘要发送，让积压在限速内尽快清空。
+        """
+        while True:
+            batch = [await self.handoff.get()]
+            lag = time.monotonic() - batch[0][2]
+            if DIGEST_MAX_LAG and lag >= DIGEST_MAX_LAG:
+                while len(batch) < DIGEST_MAX_ARTICLES and not self.handoff.empty():
+                    batch.append(self.handoff.get_nowait())
+            try:
+                if len(batch) == 1:
+                    article, translation, _ = batch[0]
+                    await self._process_single_article(article, await translation)
+                else:
+                    print(f"[Digest] 发送滞后 {lag:.0f}s，合并 {len(batch)} 篇为摘要"
+                          f"（仍积压 {self.handoff.qsize()} 篇）")
+                    await self.bot.send_digest([
+                        _with_translation(article, await translation) for article, translation, _ in batch
+                    ])
+            except Exception as e:
+                print(f"[ERROR] 文章推送异常: {str(e)}")
+            finally:
+                for _ in batch:
+                    self.handoff.task_done()
+
+    async def _process_single_article(self, article: dict, translated: Optional[dict]):
+        """原子化处理单篇文章"""
         # 阶段2: 构建最终消息
-        processed = article.copy()
-        if translated:
-            processed.update({
-                'translated_title': translated.get('title', ''),
-                'translated_description': translated.get('description', '')
-            })
+        processed = _with_translation(article, translated)
 
         # 阶段3: 发送完整消息
         await self.bot.send_article(processed)
@@ -329,6 +802,8 @@ class RobustWSClient:
         # self.processed_ids.add(article_id)
     async def listen_forever(self):
         """持久化监听循环"""
+        # 发送协程跨越重连存活，断线期间已接收的文章照常推送
+        self.sender = asyncio.create_task(self._send_loop())
         while True:
             try:
                 async with (await self._safe_connect()) as ws:
@@ -342,6 +817,7 @@ class RobustWSClient:
 
 async def main():
     client = RobustWSClient()
+    await start_metrics_server(BOT_METRICS_PORT, METRICS_HOST)
     await client.listen_forever()
 
 
@@ -0,0 +1,111 @@
+"""翻译结果缓存：内存 LRU + SQLite 持久化，按 (目标语言, 标题, 描述) 的内容哈希寻址
+
+重启、重发或其他来源的同一标题都直接命中缓存，不再重复调用 LLM。
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from Metrics import REGISTRY
+
+TRANSLATION_CACHE_SIZE = 2000  # 内存层最多保留的译文条数
+
+CACHE_LOOKUPS = REGISTRY.counter(
+    'translation_cache_lookups_total', '翻译缓存查询结果（memory/disk/miss）', ('result',)
+)
+
+CREATE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS translations (
+        key TEXT PRIMARY KEY,
+        lang TEXT NOT NULL,
+        outputs TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    ) WITHOUT ROWID
+'''
+SELECT_SQL = 'SELECT outputs FROM translations WHERE key = ?'
+UPSERT_SQL = 'INSERT OR REPLACE INTO translations (key, lang, outputs) VALUES (?, ?, ?)'
+
+
+def translation_key(title, description, lang):
+    """内容寻址键：相同原文 + 目标语言得到相同的键"""
+    raw = json.dumps([lang, title or '', description or ''], ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class TranslationCache:
+    """两级缓存：内存 LRU 在前，SQLite 文件在后；path 为空时只用内存层"""
+
+    def __init__(self, path='translations.db', size=TRANSLATION_CACHE_SIZE):
+        self.size = size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        # 单线程执行器：SQLite 连接只在同一线程内串行使用，不阻塞事件循环
+        self._executor = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(CREATE_TABLE_SQL)
+            self._conn.commit()
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='translation-cache')
+
+    def _remember(self, key, outputs):
+        with self._lock:
+            self._memory[key] = outputs
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.size:
+                self._memory.popitem(last=False)
+
+    def _load(self, key):
+        row = self._conn.execute(SELECT_SQL, (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _store(self, key, lang, outputs):
+        self._conn.execute(UPSERT_SQL, (key, lang, json.dumps(outputs, ensure_ascii=False)))
+        self._conn.commit()
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def get(self, key):
+        """依次查内存层与 SQLite 层，磁盘命中会回填内存层；未命中返回 None"""
+        with self._lock:
+            outputs = self._memory.get(key)
+            if outputs is not None:
+                self._memory.move_to_end(key)
+        if outputs is not None:
+            CACHE_LOOKUPS.inc(result='memory')
+            return outputs
+        if self._conn is not None:
+            try:
+                outputs = await self._run(self._load, key)
+            except (sqlite3.Error, ValueError) as e:
+                print(f"[WARN] 读取翻译缓存失败: {str(e)}")
+                outputs = None
+            if outputs is not None:
+                CACHE_LOOKUPS.inc(result='disk')
+                self._remember(key, outputs)
+                return outputs
+        CACHE_LOOKUPS.inc(result='miss')
+        return None
+
+    async def put(self, key, lang, outputs):
+        """写入两级缓存；持久化失败只告警，不影响推送"""
+        self._remember(key, outputs)
+        if self._conn is not None:
+            try:
+                await self._run(self._store, key, lang, outputs)
+            except sqlite3.Error as e:
+                print(f"[WARN] 写入翻译缓存失败: {str(e)}")
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
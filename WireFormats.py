@@ -0,0 +1,87 @@
+"""WebSocket 消息编码：按子协议协商 JSON 文本或 msgpack 二进制帧
+
+msgpack / orjson 为可选依赖，未安装时自动退回标准库 json。
+"""
+import json
+
+from Metrics import STAGE_SECONDS
+
+try:
+    import orjson
+except ImportError:  # 可选：更快的 JSON 编码
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # 可选：二进制帧
+    msgpack = None
+
+JSON_SUBPROTOCOL = 'news.json'
+MSGPACK_SUBPROTOCOL = 'news.msgpack'
+
+
+def available_subprotocols():
+    """本端支持的子协议，按偏好排序（未协商时默认 JSON 文本）"""
+    protocols = [JSON_SUBPROTOCOL]
+    if msgpack is not None:
+        protocols.insert(0, MSGPACK_SUBPROTOCOL)
+    return protocols
+
+
+def dumps_json(payload):
+    """序列化为 JSON 文本，优先使用 orjson"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload).decode()
+        except TypeError:  # orjson 不支持的类型（如超长整数）退回标准库
+            pass
+    return json.dumps(payload)
+
+
+def encode(payload, wire_format=None):
+    """按子协议编码：msgpack 返回 bytes（二进制帧），其余返回 str（文本帧）"""
+    if wire_format == MSGPACK_SUBPROTOCOL and msgpack is not None:
+        return msgpack.packb(payload, use_bin_type=True)
+    return dumps_json(payload)
+
+
+def loads(data):
+    """解码收到的帧：二进制按 msgpack，文本按 JSON；格式错误抛出 ValueError"""
+    if isinstance(data, (bytes, bytearray)):
+        if msgpack is None:
+            raise ValueError('收到二进制帧但未安装 msgpack')
+        try:
+            return msgpack.unpackb(data, raw=False)
+        except Exception as e:
+            raise ValueError(f'无效的 msgpack 数据: {e}') from e
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def project(payload, fields):
+    """按字段投影消息中的 articles 列表，fields 为 None 时原样返回"""
+    if not fields or payload.get('articles') is None:
+        return payload
+    return {
+        **payload,
+        'articles': [{k: article[k] for k in fields if k in article} for article in payload['articles']]
+    }
+
+
+class WireMessage:
+    """待发送消息：每种格式/字段投影只编码一次，由所有相同设置的客户端共享"""
+
+    __slots__ = ('payload', '_encoded')
+
+    def __init__(self, payload):
+        self.payload = payload
+        self._encoded = {}
+
+    def encode(self, wire_format=None, fields=None):
+        key = (wire_format or JSON_SUBPROTOCOL, fields)
+        data = self._encoded.get(key)
+        if data is None:
+            with STAGE_SECONDS.time(stage='serialize'):
+                data = self._encoded[key] = encode(project(self.payload, fields), key[0])
+        return data
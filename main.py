@@ -1,285 +1,955 @@
 import asyncio
-import json
+import multiprocessing
 import os
+import re
 import time
-from collections import deque
+from contextlib import asynccontextmanager
+from collections import Counter, OrderedDict, defaultdict, deque
+from datetime import datetime, timedelta
 from threading import Lock
-from urllib.parse import urlparse
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
 import aiohttp
 import dotenv
-import feedparser
 import pytz
-from dateutil import parser
 from websockets.exceptions import ConnectionClosedOK
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
 from websockets.legacy.server import WebSocketServerProtocol, serve
-from xml.etree import ElementTree as ET
-from DatabaseManager import DatabaseManager
+from DatabaseManager import (AsyncDatabaseManager, DatabaseManager, normalize_tickers, parse_timestamp,
+                             to_epoch, to_history_row)
+from IngestChannel import IngestPublisher, IngestSubscriber
+from Metrics import REGISTRY, STAGE_SECONDS, start_metrics_server
+from RateLimit import TokenBucket
+from NewsSources import ARTICLES_TOTAL, POLL_LEARN_WINDOW, AdaptiveScheduler, IngestEngine, SourceRegistry
+from WireFormats import JSON_SUBPROTOCOL, WireMessage, available_subprotocols, loads
 from dateutil.tz import UTC
 
 dotenv.load_dotenv()
 # 全局配置
-# RSS_URL = os.getenv('BLOOMBERG_RSS_URL')
-NEWS_SITEMAP = os.getenv('BLOOMBERG_NEWS_SITEMAP')
-CHECK_INTERVAL = 60  # 数据检查间隔（秒）
-SITEMAP_INTERVAL = 60  # 站点地图抓取间隔（秒）
+CHECK_INTERVAL = 60  # 初始数据检查间隔（秒），之后按数据源自适应调整
+HTTP_TIMEOUT = 10  # 抓取超时（秒）
+HTTP_POOL_SIZE = 10  # 抓取连接池大小
 PING_INTERVAL = 20
 PING_TIMEOUT = 20
+DB_POOL_SIZE = 4  # 数据库读连接池大小
+SEEN_GUID_CAPACITY = 50000  # 内存去重集合容量
+LOOP_LAG_INTERVAL = 0.5  # 事件循环阻塞采样间隔（秒）
+STATS_INTERVAL = 60  # 统计输出间隔（秒）
+HISTORY_CACHE_PAGES = 10  # 预序列化历史页缓存页数
+RETENTION_DAYS = int(os.getenv('NEWS_RETENTION_DAYS', 90))  # 热表保留天数
+ARCHIVE_DIR = os.getenv('NEWS_ARCHIVE_DIR', 'archive')  # 归档分区目录
+RETENTION_INTERVAL = 3600  # 归档检查间隔（秒）
+CLIENT_QUEUE_SIZE = 256  # 每个客户端的发送队列长度
+SEND_TIMEOUT = 10  # 单条消息发送超时（秒）
+SLOW_CLIENT_CLOSE_CODE = 1008  # 慢客户端被驱逐时的关闭码
+MAX_SUBSCRIPTION_TERMS = 100  # 单个客户端订阅条件数上限
+REPLAY_CAPACITY = 1000  # 内存重放缓冲条数
+REPLAY_PAGE_SIZE = 500  # 单条 resume 消息最多补发条数
+MAX_PAGE_OFFSET = 2 ** 31  # get_page 允许的最大行偏移（页码 * 每页条数）
+WS_COMPRESSION = os.getenv('WS_COMPRESSION', 'deflate').lower()  # deflate / none
+WS_DEFLATE_WINDOW_BITS = 12  # 压缩窗口（越小每连接内存越少）
+WS_DEFLATE_MEM_LEVEL = 5  # zlib memLevel
+WS_HOST = os.getenv('WS_HOST', 'localhost')
+WS_PORT = int(os.getenv('WS_PORT', 8765))
+WS_WORKERS = int(os.getenv('WS_WORKERS', 0))  # >0 时启用多进程：1 个抓取进程 + N 个 WebSocket 工作进程
+INGEST_SOCKET = os.getenv('INGEST_SOCKET', 'ingest.sock')  # 抓取进程与工作进程间的 Unix 套接字
+ARTICLE_CACHE_SIZE = 2000  # 文章详情 LRU 缓存条数
+MAX_ARTICLE_BATCH = 50  # 单次 get_article 最多请求条数（每条消耗一个令牌，不超过桶容量）
+# 可投影的文章字段；guid/published 始终保留（游标分页依赖）
+ARTICLE_FIELDS = frozenset({
+    "guid", "title", "description", "link", "published", "category",
+    "media_url", "stock_tickers", "source", "seq"
+})
+REQUIRED_FIELDS = frozenset({"guid", "published"})
+ALL_FIELDS = tuple(sorted(ARTICLE_FIELDS))
+MAX_CONNECTIONS = int(os.getenv('MAX_CONNECTIONS', 1000))  # 每个进程的最大连接数，超出以 1013 关闭
+OVERLOAD_CLOSE_CODE = 1013  # Try Again Later
+MAX_CONCURRENT_QUERIES = int(os.getenv('MAX_CONCURRENT_QUERIES', DB_POOL_SIZE * 2))  # 全局并发查询上限
+MAX_QUERY_BACKLOG = 100  # 等待查询槽位的请求上限，超出直接拒绝
+# 各动作的令牌桶：(每秒补充令牌数, 桶容量)
+ACTION_RATE_LIMITS = {
+    "get_page": (5, 20),
+    "search": (2, 10),
+    "get_article": (10, 50),
+    "resume": (1, 5),
+    "subscribe": (1, 5),
+    "set_fields": (1, 5),
+    "reload": (1 / 30, 1),
+}
+DEFAULT_RATE_LIMIT = (5, 20)
+QUERY_ACTIONS = frozenset({"get_page", "search", "get_article", "resume"})  # 需要占用查询槽位的动作
+METRICS_HOST = os.getenv('METRICS_HOST', 'localhost')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9100))  # Prometheus 指标端口（0 为关闭）
+# 多进程时工作进程 i 使用 METRICS_WORKER_PORT_BASE + i（0 为关闭），与机器人默认的 9101 错开
+METRICS_WORKER_PORT_BASE = int(os.getenv('METRICS_WORKER_PORT_BASE', 9110))
 
-# 线程安全连接管理
-connected_clients = deque()
-clients_lock = Lock()
+# 指标
+PUBLISH_LATENCY = REGISTRY.histogram(
+    'news_publish_latency_seconds', '从文章发布时间到入库/广播的延迟（秒）', ('stage',)
+)
+WS_SEND_SECONDS = REGISTRY.histogram('news_ws_send_seconds', 'WebSocket 单条消息发送耗时（秒）')
+WS_MESSAGES_SENT = REGISTRY.counter('news_ws_messages_sent_total', 'WebSocket 已发送消息数')
+WS_DROPPED = REGISTRY.counter('news_ws_dropped_messages_total', '因客户端过慢丢弃的消息数')
+WS_EVICTIONS = REGISTRY.counter('news_ws_evictions_total', '被断开的慢客户端数', ('reason',))
+WS_RATE_LIMITED = REGISTRY.counter('news_ws_rate_limited_total', '被限流的请求数', ('action',))
+WS_REJECTED = REGISTRY.counter('news_ws_rejected_total', '被拒绝的请求/连接数', ('reason',))
+
+
+class SeenGuids:
+    """有界GUID集合（LRU淘汰），命中即可确定已入库"""
+
+    def __init__(self, capacity=SEEN_GUID_CAPACITY):
+        self.capacity = capacity
+        self._guids = OrderedDict()
+
+    def __contains__(self, guid):
+        return guid in self._guids
+
+    def __len__(self):
+        return len(self._guids)
+
+    def add(self, guid):
+        self._guids[guid] = None
+        self._guids.move_to_end(guid)
+        if len(self._guids) > self.capacity:
+            self._guids.popitem(last=False)
+
+    def update(self, guids):
+        for guid in guids:
+            self.add(guid)
+
+
+class ReplayLog:
+    """按序列号排列的最近新增文章环形缓冲，用于断线重连后补发"""
+
+    def __init__(self, capacity=REPLAY_CAPACITY, last_seq=0):
+        self._articles = deque(maxlen=capacity)
+        self.last_seq = last_seq
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self._articles)
+
+    def extend(self, articles):
+        with self.lock:
+            for article in articles:
+                self._articles.append(article)
+                self.last_seq = max(self.last_seq, article["seq"])
+
+    def since(self, seq, limit=REPLAY_PAGE_SIZE):
+        """返回 seq 之后的文章；缺口早于缓冲区时返回 None（需回源数据库）"""
+        with self.lock:
+            if seq >= self.last_seq:
+                return []
+            if not self._articles or seq < self._articles[0]["seq"] - 1:
+                return None
+            missed = [a for a in self._articles if a["seq"] > seq]
+        return missed[:limit]
+
+
+def normalize_fields(fields):
+    """规范化字段投影：None/空表示全部字段；类型错误或未知字段抛出 ValueError"""
+    if fields is None:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    elif not isinstance(fields, list) or not all(isinstance(f, str) for f in fields):
+        raise ValueError("fields 必须是字符串或字符串列表")
+    fields = {f.strip() for f in fields if f.strip()}
+    if not fields:
+        return None
+    unknown = fields - ARTICLE_FIELDS
+    if unknown:
+        raise ValueError(f"未知字段: {', '.join(sorted(unknown))}")
+    return tuple(sorted(fields | REQUIRED_FIELDS))
+
+
+class ArticleCache:
+    """文章详情 LRU 缓存，内容被更新时随 save_news 回调失效"""
+
+    def __init__(self, capacity=ARTICLE_CACHE_SIZE):
+        self.capacity = capacity
+        self.lock = Lock()
+        self._articles = OrderedDict()
+
+    def __len__(self):
+        return len(self._articles)
+
+    def get(self, guid):
+        with self.lock:
+            article = self._articles.get(guid)
+            if article is not None:
+                self._articles.move_to_end(guid)
+            return article
+
+    def put(self, article):
+        with self.lock:
+            self._articles[article["guid"]] = article
+            self._articles.move_to_end(article["guid"])
+            if len(self._articles) > self.capacity:
+                self._articles.popitem(last=False)
+
+    def on_saved(self, items, replaced=False):
+        """写入回调：仅更新/归档会改变已缓存内容"""
+        if not replaced:
+            return
+        with self.lock:
+            for item in items:
+                self._articles.pop(item.get("guid"), None)
+
+    def clear(self):
+        with self.lock:
+            self._articles.clear()
+
+
+class HistoryPageCache:
+    """预序列化的历史页缓存，随 save_news 写穿更新"""
+
+    def __init__(self, page_size, max_pages=HISTORY_CACHE_PAGES):
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.lock = Lock()
+        self.total = None
+        self.version = 0  # 每次写入递增，用于丢弃过期的回填
+        self._pages = OrderedDict()  # page -> (articles, WireMessage)
+
+    def get(self, page):
+        """返回已序列化的历史消息，未命中返回 None"""
+        with self.lock:
+            cached = self._pages.get(page)
+            if cached is None:
+                return None
+            self._pages.move_to_end(page)
+            return cached[1]
+
+    def put(self, page, history, version):
+        """缓存历史页（各格式按需编码一次），期间发生写入则只返回不缓存"""
+        message = WireMessage({"type": "history", **history})
+        with self.lock:
+            if version == self.version:
+                self.total = history["total"]
+                self._pages[page] = (history["articles"], message)
+                if len(self._pages) > self.max_pages:
+                    self._pages.popitem(last=False)
+        return message
+
+    def on_saved(self, items, replaced=False):
+        """写入回调：更新总数，增量重建第1页，其余页失效"""
+        with self.lock:
+            self.version += 1
+            first = self._pages.get(1)
+            self._pages.clear()
+            if replaced or self.total is None:
+                self.total = None
+                return
+            self.total += len(items)
+            if first is None:
+                return
+            rows = [to_history_row(item) for item in items]
+            articles = sorted(
+                rows + first[0],
+                key=lambda a: (to_epoch(a["published"]), a["guid"]),
+                reverse=True
+            )[:self.page_size]
+            last_seq = max((item["seq"] for item in items if "seq" in item), default=None)
+            history = self.page_payload(1, articles, self.total, last_seq)
+            self._pages[1] = (articles, WireMessage({"type": "history", **history}))
+
+    def page_payload(self, page, articles, total, last_seq=None):
+        return {
+            "articles": articles,
+            "total": total,
+            "page": page,
+            "page_size": self.page_size,
+            "total_pages": (total + self.page_size - 1) // self.page_size,
+            "next_cursor": _next_cursor(articles, self.page_size),
+            "last_seq": last_seq
+        }
+
+
+def _next_cursor(history, page_size):
+    """根据本页最后一条生成下一页游标，不足一页时返回 None"""
+    if len(history) < page_size:
+        return None
+    last = history[-1]
+    return {"before_pub_date": last["published"], "before_guid": last["guid"]}
 
 
 class NewsCache:
-    def __init__(self):
+    def __init__(self, ingest=True):
         self.latest_pub_date = None
-        self.cache = deque(maxlen=1000)
         self.lock = Lock()
-        self.db = DatabaseManager()
+        # 工作进程以只读方式打开（建表/迁移与写入只在抓取进程进行）
+        self.db = DatabaseManager(
+            pooled=True, pool_size=DB_POOL_SIZE, archive_dir=ARCHIVE_DIR, read_only=not ingest
+        )
+        self.adb = AsyncDatabaseManager(self.db, max_workers=DB_POOL_SIZE)
         self.page_size = 100
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.history_cache = HistoryPageCache(self.page_size)
+        self.db.add_save_listener(self.history_cache.on_saved)
+        self.article_cache = ArticleCache()
+        self.db.add_save_listener(self.article_cache.on_saved)
+        self.replay = ReplayLog(last_seq=self.db.get_last_seq())
+        # 工作进程只读，不抓取数据源
+        self.ingest = ingest
+        self.sources = SourceRegistry.from_env() if ingest else SourceRegistry()
+        self.scheduler = AdaptiveScheduler(initial=CHECK_INTERVAL)
+        self.engine = IngestEngine(self.sources, self.scheduler)
+        self.seen = SeenGuids()
+        self._fetching: Optional[asyncio.Future] = None  # 进行中的抓取，用于合并并发请求
+        self._fetching_forced = False  # 进行中的抓取是否为强制抓取
+        if ingest:
+            # 启动时从数据库预热去重集合
+            self.seen.update(self.db.get_recent_guids(self.seen.capacity))
 
-    def get_history(self, page=1):
+    async def get_history(self, page=1):
         """分页获取历史数据"""
         start_idx = (page - 1) * self.page_size
         end_idx = start_idx + self.page_size
-        total = self.db.get_total_count()
-        history = self.db.get_history_page(start_idx, self.page_size)
+        last_seq = self.replay.last_seq  # 先取序列号，保证不晚于本页数据
+        total = self.history_cache.total
+        if total is None:
+            total = await self.adb.get_total_count()
+        history = await self.adb.get_history_page(start_idx, self.page_size)
+        return self.history_cache.page_payload(page, history, total, last_seq)
+
+    async def get_history_message(self, page=1):
+        """获取序列化后的历史消息，优先命中缓存"""
+        message = self.history_cache.get(page)
+        if message is not None:
+            return message
+        version = self.history_cache.version
+        history = await self.get_history(page)
+        return self.history_cache.put(page, history, version)
+
+    async def get_history_by_cursor(self, before_pub_date=None, before_guid=None):
+        """游标分页获取历史数据，任意深度的页成本一致"""
+        history = await self.adb.get_history_before(before_pub_date, before_guid, self.page_size)
         return {
             "articles": history,
-            "total": total,
-            "page": page,
             "page_size": self.page_size,
-            "total_pages": (total + self.page_size - 1) // self.page_size
+            "next_cursor": _next_cursor(history, self.page_size)
         }
-    def _process_entries(self, entries):
-        """处理并存储条目，返回分页结果"""
-        valid_entries = [e for e in entries if e is not None]
-        sorted_entries = sorted(valid_entries, key=lambda x: parser.parse(x["published"]))
 
-        new_articles = []
-        with self.lock:
-            for entry in sorted_entries:
-                pub_date = parser.parse(entry["published"])
-                if not self.latest_pub_date or pub_date > self.latest_pub_date:
-                    new_articles.append(entry)
-                    self.cache.append(entry)
-                    if not self.latest_pub_date or pub_date > self.latest_pub_date:
-                        self.latest_pub_date = pub_date
+    async def resume(self, last_seq):
+        """获取 last_seq 之后错过的文章，优先命中内存缓冲，否则按序列号查库"""
+        articles = self.replay.since(last_seq)
+        if articles is None:
+            articles = await self.adb.get_news_since_seq(last_seq, REPLAY_PAGE_SIZE)
+        return {
+            "articles": articles,
+            "last_seq": articles[-1]["seq"] if articles else max(last_seq, self.replay.last_seq),
+            "has_more": len(articles) >= REPLAY_PAGE_SIZE
+        }
 
-            if new_articles:
-                self.db.save_news(new_articles)
+    async def get_articles(self, guids):
+        """批量获取文章详情（与 guids 对齐，未找到为 None），优先命中 LRU 缓存；未命中的部分一次性查库（含归档分区）"""
+        articles = {guid: self.article_cache.get(guid) for guid in guids}
+        missing = [guid for guid, article in articles.items() if article is None]
+        if missing:
+            found = await self.adb.get_news_by_guids(missing)
+            for article in found.values():
+                self.article_cache.put(article)
+            articles.update(found)
+        return [articles.get(guid) for guid in guids]
 
-        # 对新文章进行分页
-        total = len(new_articles)
+    def apply_published(self, articles):
+        """工作进程：应用抓取进程推送的新文章，返回本地尚未见过的部分"""
+        fresh = [a for a in articles if a["seq"] > self.replay.last_seq]
+        if fresh:
+            self.history_cache.on_saved(fresh)
+            self.replay.extend(fresh)
+        return fresh
+
+    async def search(self, query=None, tickers=None, since=None,
+                     before_pub_date=None, before_guid=None):
+        """全文/股票代码搜索，游标分页"""
+        articles = await self.adb.search_news(
+            query, tickers, since, before_pub_date, before_guid, self.page_size
+        )
         return {
-            "articles": new_articles[:self.page_size],
-            "total": total,
-            "page": 1,
+            "articles": articles,
             "page_size": self.page_size,
-            "total_pages": (total + self.page_size - 1) // self.page_size
+            "next_cursor": _next_cursor(articles, self.page_size)
         }
-    async def fetch(self):
-        """统一数据抓取入口"""
-        try:
-            # # 并行获取数据源
-            # rss, sitemap = await asyncio.gather(
-            #     self._fetch_rss(),
-            #     self._fetch_sitemap()
-            # )
-            # return self._process_entries(rss + sitemap)
-            sitemap = await self._fetch_sitemap()
-            return self._process_entries(sitemap)
-        except Exception as e:
-            print(f"数据抓取失败: {str(e)}")
-            return []
 
-    # async def _fetch_rss(self):
-    #     """处理RSS源"""
-    #     async with aiohttp.ClientSession() as session:
-    #         try:
-    #             async with session.get(RSS_URL) as resp:
-    #                 data = await resp.text()
-    #                 feed = feedparser.parse(data)
-    #                 return [self._parse_rss_entry(e) for e in feed.entries]
-    #         except Exception as e:
-    #             print(f"RSS抓取失败: {str(e)}")
-    #             return []
-
-    def _parse_rss_entry(self, entry):
-        """解析RSS条目"""
-        try:
-            pub_date = parser.parse(entry.published).astimezone(UTC)
-            tags = getattr(entry, "tags", None)
-            stock_tickers = ", ".join(t.term for t in tags) if tags else ""
-            return {
-                "guid": entry.get("id", entry.link),
-                "title": entry.title,
-                "description": entry.description,
-                "link": entry.link,
-                "published": pub_date.isoformat(),
-                "stock_tickers": stock_tickers,
-                "media_url": entry.enclosures[0].href if entry.enclosures else "",
-                "source": "rss"
-            }
-        except Exception as e:
-            print(f"RSS条目解析失败: {str(e)}")
-            return None
+    async def fetch(self, force=False):
+        """统一数据抓取入口，force=True 时忽略调度立即抓取所有数据源
 
-    async def _fetch_sitemap(self):
-        """处理站点地图"""
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(NEWS_SITEMAP, timeout=10) as resp:
-                    xml_data = await resp.text()
-                    return self._parse_sitemap(xml_data)
-            except Exception as e:
-                print(f"Sitemap抓取失败: {str(e)}")
+        已有抓取进行中时合并到该次抓取并返回空列表（新文章由发起方广播）。
+        强制抓取遇到进行中的调度抓取（只抓了到期的数据源）时，等其结束后再执行一次
+        强制抓取；多个同时等待的强制请求只会触发一次。
+        """
+        while self._fetching is not None:
+            joined_forced = self._fetching_forced
+            await asyncio.shield(self._fetching)
+            if not force or joined_forced:
                 return []
-
-    def _parse_sitemap(self, xml_data):
-        """解析XML站点地图"""
-        namespaces = {
-            'ns': 'http://www.sitemaps.org/schemas/sitemap/0.9',
-            'news': 'http://www.google.com/schemas/sitemap-news/0.9',
-            'image': 'http://www.google.com/schemas/sitemap-image/1.1'
-        }
-
-        entries = []
+        self._fetching = asyncio.get_running_loop().create_future()
+        self._fetching_forced = force
         try:
-            root = ET.fromstring(xml_data)
-            for url in root.findall('ns:url', namespaces):
-                entry = self._parse_sitemap_entry(url, namespaces)
-                if entry: entries.append(entry)
-        except Exception as e:
-            print(f"Sitemap解析失败: {str(e)}")
-        return entries
+            return await self._fetch(force)
+        finally:
+            self._fetching.set_result(None)
+            self._fetching = None
 
-    def _parse_sitemap_entry(self, url, namespaces):
-        """解析单个站点地图条目"""
+    async def _fetch(self, force):
         try:
-            loc = url.find('ns:loc', namespaces).text
-            news = url.find('news:news', namespaces)
-
-            # 解析元数据
-            pub_date = parser.parse(news.find('news:publication_date', namespaces).text).astimezone(UTC)
-            title = news.find('news:title', namespaces).text
-
-            # 股票代码处理
-            stock_elem = news.find('news:stock_tickers', namespaces)
-            stock_tickers = stock_elem.text if stock_elem is not None else ""
-
-            # 图片处理
-            image = url.find('image:image', namespaces)
-            media_url = image.find('image:loc', namespaces).text if image is not None else ""
-
-            return {
-                #根据url的/分割，取最后一个
-                "guid": loc.split("/")[-1],
-                "title": title,
-                "link": loc,
-                "published": pub_date.isoformat(),
-                "stock_tickers": stock_tickers,
-                "media_url": media_url,
-                "source": "sitemap",
-                "description": ""  # Sitemap无描述字段
-            }
+            await self._ensure_session()
+            if self.scheduler.needs_relearn():
+                since_ts = int(time.time()) - POLL_LEARN_WINDOW
+                self.scheduler.learn({
+                    source.name: 0 for source in self.sources
+                } | await self.adb.count_recent_by_source(since_ts))
+
+            # 并行获取所有到期数据源，合并去重后统一入库
+            with STAGE_SECONDS.time(stage='fetch'):
+                entries, finished = await self.engine.collect(self.session, self.seen, force)
+            new_articles = await self.adb.run(self._process_entries, entries)
+
+            new_by_source = Counter(article.get("source") for article in new_articles)
+            for source in finished:
+                self.scheduler.observe(source, new_by_source[source.name])
+            return new_articles
         except Exception as e:
-            print(f"条目解析异常: {str(e)}")
-            return None
+            print(f"数据抓取失败: {str(e)}")
+            return []
+
+    async def _ensure_session(self):
+        """按需创建长连接会话（复用TCP/TLS连接）"""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+                headers={"Accept-Encoding": "gzip, deflate"}
+            )
+
+    async def close(self):
+        """安全关闭会话"""
+        self.engine.cancel()
+        if self.session and not self.session.closed:
+            await self.session.close()
 
     def _process_entries(self, entries):
         """处理并存储条目"""
         valid_entries = [e for e in entries if e is not None]
-        sorted_entries = sorted(valid_entries, key=lambda x: parser.parse(x["published"]))
+        for entry in valid_entries:
+            if entry.get("pub_ts") is None:
+                entry["pub_ts"] = to_epoch(entry["published"])
+        sorted_entries = sorted(valid_entries, key=lambda x: x["pub_ts"])
 
-        new_articles = []
         with self.lock:
-            for entry in sorted_entries:
-                pub_date = parser.parse(entry["published"])
-                guid = entry.get("guid")
-                # 使用 is_news_exists 排除重复条目
-                if guid and not self.db.is_news_exists(guid):
-                    new_articles.append(entry)
-                    self.cache.append(entry)
-                    if not self.latest_pub_date or pub_date > self.latest_pub_date:
-                        self.latest_pub_date = pub_date
-
+            with STAGE_SECONDS.time(stage='dedup'):
+                new_articles = self._filter_new(sorted_entries)
             if new_articles:
-                self.db.save_news(new_articles)
+                newest = datetime.fromtimestamp(new_articles[-1]["pub_ts"], UTC)
+                if not self.latest_pub_date or newest > self.latest_pub_date:
+                    self.latest_pub_date = newest
+                # 仅广播实际入库的条目（附带序列号）
+                new_articles = self.db.save_news(new_articles)
+                observe_latency(new_articles, 'saved')
+                self.replay.extend(new_articles)
+                self.seen.update(e["guid"] for e in new_articles)
         return new_articles
 
+    def _filter_new(self, entries):
+        """批量去重：内存集合排除已知GUID，剩余候选仅查询一次数据库"""
+        candidates = {}
+        for entry in entries:
+            guid = entry.get("guid")
+            if not guid or guid in self.seen:
+                continue
+            candidates.setdefault(guid, entry)
+        if not candidates:
+            return []
+
+        existing = self.db.get_existing_guids(candidates)
+        self.seen.update(existing)
+        return [entry for guid, entry in candidates.items() if guid not in existing]
+
+
+news_cache: Optional[NewsCache] = None  # 在进程入口中创建（多进程模式下各进程各自持有）
+ingest_publisher: Optional[IngestPublisher] = None  # 抓取进程
+ingest_subscriber: Optional[IngestSubscriber] = None  # WebSocket 工作进程
+
+
+def observe_latency(articles, stage):
+    """记录文章从发布时间到当前阶段的延迟"""
+    now = time.time()
+    for article in articles:
+        if article.get("pub_ts") is not None:
+            PUBLISH_LATENCY.observe(max(0.0, now - article["pub_ts"]), stage=stage)
+    ARTICLES_TOTAL.inc(len(articles), stage=stage)
 
-news_cache = NewsCache()
+
+def publish_articles(articles):
+    """分发新文章：单进程直接入队客户端，多进程推送给各工作进程"""
+    with STAGE_SECONDS.time(stage='broadcast'):
+        if ingest_publisher is not None:
+            workers = ingest_publisher.publish({"type": "articles", "articles": articles})
+        else:
+            # 按订阅条件分组入队，由各客户端的写任务发送
+            delivered = clients.publish(articles)
+    observe_latency(articles, 'broadcast')
+    if ingest_publisher is not None:
+        print(f"广播 {len(articles)} 条新文章，推送 {workers} 个工作进程")
+    else:
+        print(f"广播 {len(articles)} 条新文章，投递 {delivered} 个客户端")
 
 
 async def broadcast_news():
     """新闻广播主循环"""
-    last_sitemap_fetch = 0
     while True:
         try:
-            # 定时抓取sitemap
-            now = time.time()
-            if now - last_sitemap_fetch > SITEMAP_INTERVAL:
-                print("开始抓取站点地图...")
-                await news_cache._fetch_sitemap()
-                last_sitemap_fetch = now
-
-            # 获取并广播新文章
+            # 获取并广播新文章（每轮只抓取一次站点地图）
             new_articles = await news_cache.fetch()
             if new_articles:
-                print(f"广播 {len(new_articles)} 条新文章")
-                msg = json.dumps({
-                    "type": "update",
-                    "count": len(new_articles),
-                    "articles": new_articles
-                })
-
-                # 并行发送
-                with clients_lock:
-                    tasks = [asyncio.create_task(safe_send(ws, msg))
-                             for ws in list(connected_clients)]
-                    await asyncio.gather(*tasks, return_exceptions=True)
+                publish_articles(new_articles)
 
         except Exception as e:
             print(f"广播异常: {str(e)}")
         finally:
-            await asyncio.sleep(CHECK_INTERVAL)
+            # 按各数据源的自适应间隔等待（从本轮开始时间起算）
+            await asyncio.sleep(news_cache.engine.next_delay())
 
 
-async def safe_send(websocket, message):
-    """安全发送消息"""
-    try:
-        await websocket.send(message)
-    except (ConnectionClosedOK, asyncio.TimeoutError):
-        await disconnect_client(websocket)
-    except Exception as e:
-        print(f"发送错误: {str(e)}")
-        await disconnect_client(websocket)
+class LoopLagMonitor:
+    """事件循环阻塞采样：测量定时唤醒的延迟"""
+
+    def __init__(self, interval=LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.blocked_seconds = 0.0
+        self.max_lag = 0.0
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.blocked_seconds += lag
+            self.max_lag = max(self.max_lag, lag)
+
+
+loop_monitor = LoopLagMonitor()
+
+
+async def report_stats():
+    """定期输出数据库等待与事件循环阻塞统计"""
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        stats = news_cache.adb.stats
+        print(f"[统计] DB调用 {stats['calls']} 次, 等待 {stats['wait_seconds']:.3f}s "
+              f"(排队 {stats['queue_seconds']:.3f}s, 执行 {stats['exec_seconds']:.3f}s), "
+              f"事件循环阻塞 {loop_monitor.blocked_seconds:.3f}s (最大 {loop_monitor.max_lag * 1000:.1f}ms)")
+        if ingest_publisher is not None:
+            print(f"[统计] 工作进程 {len(ingest_publisher)} 个")
+        client_stats = clients.stats()
+        if client_stats:
+            deepest = max(client_stats, key=lambda c: c["queue_depth"])
+            print(f"[统计] 客户端 {len(client_stats)} 个, "
+                  f"降级 {sum(c['lagging'] for c in client_stats)} 个, "
+                  f"最大队列 {deepest['queue_depth']} ({deepest['remote']}), "
+                  f"累计丢弃 {sum(c['dropped'] for c in client_stats)} 条, "
+                  f"限流 {sum(c['limited'] for c in client_stats)} 次, "
+                  f"查询排队 {query_gate.waiting} 个 (拒绝 {query_gate.rejected} 次)")
+        for health in news_cache.sources.health():
+            if not health["healthy"]:
+                print(f"[统计] 数据源异常 {health['name']}: 连续失败 {health['failures']} 次, {health['last_error']}")
+
+
+async def retention_loop():
+    """定期将超出热数据窗口的新闻分批迁移到归档库，并增量回收空间"""
+    while True:
+        try:
+            cutoff = (datetime.now(UTC) - timedelta(days=RETENTION_DAYS)).isoformat()
+            moved = 0
+            while True:
+                batch = await news_cache.adb.archive_before(cutoff)
+                moved += batch
+                if not batch:
+                    break
+            if moved:
+                print(f"已归档 {moved} 条早于 {cutoff} 的新闻")
+                await news_cache.adb.incremental_vacuum()
+        except Exception as e:
+            print(f"归档异常: {str(e)}")
+        await asyncio.sleep(RETENTION_INTERVAL)
+
+
+class QueryGate:
+    """全局并发查询上限：超出槽位的请求排队，排队过长则直接拒绝"""
+
+    def __init__(self, limit=MAX_CONCURRENT_QUERIES, backlog=MAX_QUERY_BACKLOG):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.backlog = backlog
+        self.waiting = 0
+        self.rejected = 0
+
+    def admit(self):
+        """占用一个查询槽位（async with），排队已满时返回 None"""
+        if self.semaphore.locked() and self.waiting >= self.backlog:
+            self.rejected += 1
+            WS_REJECTED.inc(reason='query_backlog')
+            return None
+        return self._slot()
+
+    @asynccontextmanager
+    async def _slot(self):
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            yield
+        finally:
+            self.semaphore.release()
+
+
+class ClientConnection:
+    """单个客户端：有界发送队列 + 独立写任务，慢客户端先降级再驱逐"""
+
+    def __init__(self, websocket: WebSocketServerProtocol, remote):
+        self.websocket = websocket
+        self.remote = remote
+        self.wire_format = websocket.subprotocol or JSON_SUBPROTOCOL
+        self.fields = None  # 默认字段投影（None 为全部字段）
+        self.buckets = {}  # action -> TokenBucket
+        self.limited = 0  # 被限流的请求数
+        self.queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.dropped = 0  # 因队列溢出丢弃的消息数
+        self.lagging = False  # 已降级（丢弃积压并要求客户端重新同步）
+        self.closing = False
+        self.writer = asyncio.create_task(self._write_loop())
+
+    def send(self, message, fields=None):
+        """入队待发送消息（WireMessage），队列满时降级；降级后仍溢出则驱逐
+
+        fields 为本条消息的字段投影，缺省使用连接的默认投影。
+        """
+        if self.closing:
+            return False
+        try:
+            self.queue.put_nowait((message, fields or self.fields))
+            return True
+        except asyncio.QueueFull:
+            pass
+        if self.lagging:
+            print(f"慢客户端驱逐: {self.remote}")
+            WS_EVICTIONS.inc(reason='queue_overflow')
+            self.close(SLOW_CLIENT_CLOSE_CODE, "slow consumer")
+            return False
+
+        # 降级：丢弃积压消息，通知客户端重新拉取历史
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            self.dropped += 1
+            WS_DROPPED.inc()
+        self.dropped += 1
+        WS_DROPPED.inc()
+        self.lagging = True
+        self.queue.put_nowait((WireMessage({"type": "resync", "reason": "slow consumer"}), None))
+        print(f"慢客户端降级: {self.remote}，已丢弃 {self.dropped} 条消息")
+        return False
+
+    async def _write_loop(self):
+        try:
+            while True:
+                message, fields = await self.queue.get()
+                data = message.encode(self.wire_format, fields)
+                started = time.perf_counter()
+                await asyncio.wait_for(self.websocket.send(data), SEND_TIMEOUT)
+                WS_SEND_SECONDS.observe(time.perf_counter() - started)
+                WS_MESSAGES_SENT.inc()
+                if self.lagging and self.queue.empty():
+                    self.lagging = False
+        except (ConnectionClosedOK, asyncio.CancelledError):
+            pass
+        except asyncio.TimeoutError:
+            print(f"发送超时: {self.remote}")
+            WS_EVICTIONS.inc(reason='send_timeout')
+            self.close(SLOW_CLIENT_CLOSE_CODE, "send timeout")
+        except Exception as e:
+            print(f"发送错误: {str(e)}")
+            self.close()
+
+    def throttle(self, action, cost=1):
+        """按动作限流（cost 为本次消耗的令牌数），允许时返回 0，否则返回建议的重试等待秒数"""
+        if action not in ACTION_RATE_LIMITS:
+            action = None  # 未知动作共用一个桶
+        bucket = self.buckets.get(action)
+        if bucket is None:
+            bucket = self.buckets[action] = TokenBucket(*ACTION_RATE_LIMITS.get(action, DEFAULT_RATE_LIMIT))
+        retry_after = bucket.take(cost)
+        if retry_after:
+            self.limited += 1
+            WS_RATE_LIMITED.inc(action=action or 'other')
+        return retry_after
+
+    def close(self, code=1000, reason=""):
+        if self.closing:
+            return
+        self.closing = True
+        asyncio.create_task(self.websocket.close(code, reason))
+
+    def stats(self):
+        return {
+            "remote": self.remote,
+            "queue_depth": self.queue.qsize(),
+            "dropped": self.dropped,
+            "lagging": self.lagging,
+            "format": self.wire_format,
+            "limited": self.limited
+        }
+
+
+def keyword_terms(text):
+    """提取用于关键词匹配的小写词条"""
+    return set(re.findall(r'\w+', (text or '').lower()))
+
+
+class SubscriptionIndex:
+    """订阅倒排索引：股票代码/关键词/数据源 -> 订阅的客户端
+
+    未订阅的客户端接收全部文章；订阅后只接收命中任一条件的文章。
+    """
+
+    def __init__(self):
+        self.by_ticker = defaultdict(set)
+        self.by_keyword = defaultdict(set)
+        self.by_source = defaultdict(set)
+        self.filters = {}  # client -> (tickers, keywords, sources)
+
+    def subscribe(self, client, tickers=(), keywords=(), sources=()):
+        """替换客户端的订阅条件，条件全空等同于取消订阅；条件格式错误抛出 ValueError（原订阅保持不变）"""
+        for name, terms in (("tickers", tickers), ("keywords", keywords), ("sources", sources)):
+            if not isinstance(terms, (list, tuple, set)) or not all(isinstance(t, str) for t in terms):
+                raise ValueError(f"{name} 必须是字符串或字符串列表")
+        self.unsubscribe(client)
+        tickers = normalize_tickers(','.join(tickers))
+        keywords = set().union(*(keyword_terms(k) for k in keywords))
+        sources = {s.strip() for s in sources if s.strip()}
+        if len(tickers) + len(keywords) + len(sources) > MAX_SUBSCRIPTION_TERMS:
+            raise ValueError(f"订阅条件过多（上限 {MAX_SUBSCRIPTION_TERMS}）")
+        if not (tickers or keywords or sources):
+            return None
+
+        for index, terms in ((self.by_ticker, tickers), (self.by_keyword, keywords),
+                             (self.by_source, sources)):
+            for term in terms:
+                index[term].add(client)
+        self.filters[client] = (tickers, keywords, sources)
+        return self.filters[client]
+
+    def unsubscribe(self, client):
+        current = self.filters.pop(client, None)
+        if not current:
+            return
+        for index, terms in zip((self.by_ticker, self.by_keyword, self.by_source), current):
+            for term in terms:
+                subscribers = index.get(term)
+                if subscribers is None:
+                    continue
+                subscribers.discard(client)
+                if not subscribers:
+                    del index[term]
+
+    def is_filtered(self, client):
+        return client in self.filters
+
+    def match(self, article):
+        """返回订阅条件命中该文章的客户端集合"""
+        matched = set()
+        for ticker in normalize_tickers(article.get('stock_tickers')):
+            matched.update(self.by_ticker.get(ticker, ()))
+        if self.by_keyword:
+            text = f"{article.get('title', '')} {article.get('description', '')}"
+            for term in keyword_terms(text):
+                matched.update(self.by_keyword.get(term, ()))
+        matched.update(self.by_source.get(article.get('source'), ()))
+        return matched
+
+    def route(self, articles, unfiltered):
+        """按命中结果分组：{文章下标元组: [客户端]}，相同结果集共享一次序列化
+
+        unfiltered 为未订阅的客户端集合（由 ClientRegistry 维护），直接收到全部文章。
+        """
+        hits = defaultdict(list)
+        for i, article in enumerate(articles):
+            for client in self.match(article):
+                hits[client].append(i)
+
+        groups = defaultdict(list)
+        if unfiltered:
+            groups[tuple(range(len(articles)))] = list(unfiltered)
+        for client, indices in hits.items():
+            groups[tuple(indices)].append(client)
+        return groups
+
+
+class ClientRegistry:
+    """客户端注册表（仅在事件循环线程中访问，无需加锁）"""
+
+    def __init__(self):
+        self._clients = {}  # websocket -> ClientConnection
+        self.subscriptions = SubscriptionIndex()
+        self.unfiltered = set()  # 未订阅（接收全部文章）的客户端，路由时无需遍历全部连接
+
+    def __len__(self):
+        return len(self._clients)
+
+    def __iter__(self):
+        return iter(list(self._clients.values()))
+
+    def get(self, websocket):
+        return self._clients.get(websocket)
+
+    def add(self, websocket, remote):
+        client = ClientConnection(websocket, remote)
+        self._clients[websocket] = client
+        self.unfiltered.add(client)
+        return client
+
+    def remove(self, websocket):
+        client = self._clients.pop(websocket, None)
+        if client:
+            self.subscriptions.unsubscribe(client)
+            self.unfiltered.discard(client)
+            client.writer.cancel()
+        return client
+
+    def subscribe(self, client, **terms):
+        """替换客户端的订阅条件并同步未订阅集合；条件格式错误抛出 ValueError"""
+        result = self.subscriptions.subscribe(client, **terms)
+        if result is not None:
+            self.unfiltered.discard(client)
+        elif self._clients.get(client.websocket) is client:
+            self.unfiltered.add(client)
+        return result
+
+    def broadcast(self, message):
+        """向所有客户端入队，返回成功入队的数量"""
+        return sum(client.send(message) for client in self)
+
+    def publish(self, articles):
+        """按订阅条件分发新文章，每个不同的结果集每种格式只编码一次"""
+        delivered = 0
+        last_seq = max(article["seq"] for article in articles)
+        for indices, group in self.subscriptions.route(articles, self.unfiltered).items():
+            selected = [articles[i] for i in indices]
+            msg = WireMessage({
+                "type": "update",
+                "count": len(selected),
+                "articles": selected,
+                "last_seq": last_seq
+            })
+            delivered += sum(client.send(msg) for client in group)
+        return delivered
+
+    def stats(self):
+        return [client.stats() for client in self]
+
+
+clients = ClientRegistry()
+REGISTRY.gauge('news_ws_clients', '当前 WebSocket 客户端数', func=lambda: len(clients))
+query_gate = QueryGate()
+
+
+async def safe_send(websocket, message, fields=None):
+    """安全发送消息（进入该客户端的发送队列），message 为 dict 或 WireMessage"""
+    client = clients.get(websocket)
+    if client:
+        if not isinstance(message, WireMessage):
+            message = WireMessage(message)
+        client.send(message, fields)
 
 
 async def disconnect_client(websocket):
     """断开客户端连接"""
-    with clients_lock:
-        if websocket in connected_clients:
-            connected_clients.remove(websocket)
+    clients.remove(websocket)
     print(f"客户端断开: {websocket.remote_address}")
 
 
+def parse_cursor(cursor):
+    """校验游标 {before_pub_date, before_guid}，返回 (before_pub_date, before_guid)，格式错误抛出 ValueError"""
+    if cursor is None:
+        return None, None
+    if not isinstance(cursor, dict):
+        raise ValueError("cursor 必须是对象")
+    before_pub_date = cursor.get("before_pub_date")
+    before_guid = cursor.get("before_guid")
+    if before_pub_date is not None:
+        parse_timestamp(before_pub_date)  # 非字符串或无法解析时抛出 ValueError
+    if before_guid is not None and not isinstance(before_guid, str):
+        raise ValueError("before_guid 必须是字符串")
+    return before_pub_date, before_guid
+
+
+def _parse_page(value, page_size):
+    try:
+        page = int(value)
+    except (TypeError, ValueError):
+        page = 0
+    if page < 1:
+        raise ValueError("page 必须是正整数")
+    # 偏移量须在 SQLite 整数范围内，过大的页码直接拒绝而不是溢出
+    if page > MAX_PAGE_OFFSET // page_size:
+        raise ValueError("page 超出范围")
+    return page
+
+
+def _parse_last_seq(value):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return None
+
+
+async def send_resume(websocket, last_seq, fields=None):
+    """补发 last_seq 之后的文章（按客户端订阅条件过滤）"""
+    result = await news_cache.resume(last_seq)
+    client = clients.get(websocket)
+    if client and clients.subscriptions.is_filtered(client):
+        result["articles"] = [
+            article for article in result["articles"]
+            if client in clients.subscriptions.match(article)
+        ]
+    await safe_send(websocket, {
+        "type": "resume",
+        "count": len(result["articles"]),
+        **result
+    }, fields)
+
+
 async def client_handler(websocket: WebSocketServerProtocol):
     """客户端连接处理器"""
     remote = f"{websocket.remote_address[0]}:{websocket.remote_address[1]}"
     print(f"新连接来自: {remote}")
+    if len(clients) >= MAX_CONNECTIONS:
+        print(f"连接数已达上限 {MAX_CONNECTIONS}，拒绝: {remote}")
+        WS_REJECTED.inc(reason='max_connections')
+        await websocket.close(OVERLOAD_CLOSE_CODE, "server overloaded")
+        return
 
     try:
-        with clients_lock:
-            connected_clients.append(websocket)
+        client = clients.add(websocket, remote)
+        params = parse_qs(urlparse(websocket.path).query)
+        try:
+            # ?fields=guid,title 设置本连接的默认字段投影（历史与推送）
+            client.fields = normalize_fields(params.get("fields", [None])[0])
+        except ValueError as e:
+            await safe_send(websocket, {"type": "error", "message": str(e)})
 
-        # 发送历史数据
-        history = json.dumps({
-            "type": "history",
-            **news_cache.get_history(page=1)
-        })
-        await safe_send(websocket, history)
+        # 携带 ?last_seq= 连接时只补发错过的文章，否则发送历史数据
+        last_seq = _parse_last_seq(params.get("last_seq", [None])[0])
+        if last_seq is not None:
+            await send_resume(websocket, last_seq)
+            print(f"{remote} 从序列号 {last_seq} 恢复")
+        else:
+            history = await news_cache.get_history_message(page=1)
+            await safe_send(websocket, history)
 
         # 消息监听循环
         async for message in websocket:
@@ -294,50 +964,314 @@ async def client_handler(websocket: WebSocketServerProtocol):
         print(f"连接关闭: {remote}")
 
 
+def requested_guids(cmd):
+    """get_article 请求的 GUID 列表（去空、截断到 MAX_ARTICLE_BATCH），格式错误抛出 ValueError"""
+    guids = cmd.get("guids")
+    if guids is None:
+        guids = [cmd.get("guid")]
+    if not isinstance(guids, list):
+        raise ValueError("guids 必须是列表")
+    return [str(g) for g in guids if g][:MAX_ARTICLE_BATCH]
+
+
 async def handle_client_message(message, remote, websocket):
     """处理客户端消息"""
     try:
-        cmd = json.loads(message)
-        if cmd.get("action") == "get_page":
-            page = int(cmd.get("page", 1))
-            history = json.dumps({
-                "type": "history",
-                **news_cache.get_history(page=page)
+        cmd = loads(message)
+        if not isinstance(cmd, dict) or not isinstance(cmd.get("action"), str):
+            await safe_send(websocket, {"type": "error", "message": "消息必须是包含字符串 action 的 JSON 对象"})
+            return
+        try:
+            fields = normalize_fields(cmd.get("fields"))
+        except ValueError as e:
+            await safe_send(websocket, {"type": "error", "message": str(e)})
+            return
+
+        # 准入控制：按连接、按动作限流，查询类动作再受全局并发上限约束
+        action = cmd.get("action")
+        cost = 1
+        if action == "get_article":
+            try:
+                cost = max(1, len(requested_guids(cmd)))  # 按请求的文章数计费
+            except ValueError as e:
+                await safe_send(websocket, {"type": "error", "action": action, "message": str(e)})
+                return
+        retry_after = clients.get(websocket).throttle(action, cost)
+        if retry_after:
+            await safe_send(websocket, {
+                "type": "error",
+                "action": action,
+                "message": "rate limited",
+                "retry_after": round(retry_after, 2)
             })
-            await safe_send(websocket, history)
+            return
+        if action not in QUERY_ACTIONS:
+            await dispatch_client_message(cmd, fields, remote, websocket)
+            return
+        slot = query_gate.admit()
+        if slot is None:
+            await safe_send(websocket, {"type": "error", "action": action, "message": "server busy"})
+            return
+        async with slot:
+            await dispatch_client_message(cmd, fields, remote, websocket)
+
+    except ValueError:
+        print(f"无效消息来自 {remote}: {message[:50]!r}...")
+
+
+async def dispatch_client_message(cmd, fields, remote, websocket):
+    """执行客户端请求；参数无效（ValueError）时回复错误消息而不断开连接"""
+    try:
+        if cmd.get("action") == "get_page" and ("cursor" in cmd or "before_pub_date" in cmd):
+            before_pub_date, before_guid = parse_cursor(cmd["cursor"] if "cursor" in cmd else cmd)
+            history = {
+                "type": "history",
+                **await news_cache.get_history_by_cursor(before_pub_date, before_guid)
+            }
+            await safe_send(websocket, history, fields)
+            print(f"{remote} 请求游标分页: {before_pub_date}")
+        elif cmd.get("action") == "get_page":
+            page = _parse_page(cmd.get("page", 1), news_cache.page_size)
+            history = await news_cache.get_history_message(page=page)
+            await safe_send(websocket, history, fields)
             print(f"{remote} 请求第 {page} 页数据")
+        elif cmd.get("action") == "search":
+            query = cmd.get("query")
+            if query is not None and not isinstance(query, str):
+                raise ValueError("query 必须是字符串")
+            tickers = cmd.get("tickers") or []
+            if isinstance(tickers, str):
+                tickers = [tickers]
+            if not isinstance(tickers, list) or not all(isinstance(t, str) for t in tickers):
+                raise ValueError("tickers 必须是字符串或字符串列表")
+            before_pub_date, before_guid = parse_cursor(cmd.get("cursor"))
+            result = await news_cache.search(
+                query=query,
+                tickers=tickers,
+                since=cmd.get("since"),
+                before_pub_date=before_pub_date,
+                before_guid=before_guid
+            )
+            await safe_send(websocket, {
+                "type": "search",
+                "query": query,
+                "tickers": tickers,
+                **result
+            }, fields)
+            print(f"{remote} 搜索: {query} {tickers}")
+        elif cmd.get("action") == "subscribe":
+            as_list = lambda v: [v] if isinstance(v, str) else (v or [])
+            try:
+                result = clients.subscribe(
+                    clients.get(websocket),
+                    tickers=as_list(cmd.get("tickers")),
+                    keywords=as_list(cmd.get("keywords")),
+                    sources=as_list(cmd.get("sources"))
+                )
+            except ValueError as e:
+                await safe_send(websocket, {"type": "error", "message": str(e)})
+                return
+            tickers, keywords, sources = result or ((), (), ())
+            await safe_send(websocket, {
+                "type": "subscribed",
+                "tickers": sorted(tickers),
+                "keywords": sorted(keywords),
+                "sources": sorted(sources)
+            })
+            print(f"{remote} 订阅: {sorted(tickers)} {sorted(keywords)} {sorted(sources)}")
+        elif cmd.get("action") == "resume":
+            last_seq = _parse_last_seq(cmd.get("last_seq"))
+            if last_seq is None:
+                await safe_send(websocket, {"type": "error", "message": "last_seq 无效"})
+                return
+            await send_resume(websocket, last_seq, fields)
+            print(f"{remote} 请求补发: {last_seq}")
+        elif cmd.get("action") == "set_fields":
+            clients.get(websocket).fields = fields
+            await safe_send(websocket, {"type": "fields", "fields": list(fields or ALL_FIELDS)})
+            print(f"{remote} 设置字段投影: {fields}")
+        elif cmd.get("action") == "get_article":
+            guids = requested_guids(cmd)
+            articles = await news_cache.get_articles(guids)
+            await safe_send(websocket, {
+                "type": "article",
+                "articles": [a for a in articles if a is not None],
+                "missing": [g for g, a in zip(guids, articles) if a is None]
+            }, fields or ALL_FIELDS)  # 详情默认返回全部字段，不受连接默认投影影响
+            print(f"{remote} 请求文章详情: {len(guids)} 篇")
         elif cmd.get("action") == "reload":
             print(f"{remote} 请求重载历史数据")
-            await news_cache.fetch()
+            if ingest_subscriber is not None:
+                await ingest_subscriber.request({"action": "reload"})
+            else:
+                # 与进行中的抓取合并；由本次抓取得到的新文章照常广播
+                new_articles = await news_cache.fetch(force=True)
+                if new_articles:
+                    publish_articles(new_articles)
+    except ValueError as e:
+        await safe_send(websocket, {"type": "error", "action": cmd.get("action"), "message": str(e)})
 
-    except json.JSONDecodeError:
-        print(f"无效消息来自 {remote}: {message[:50]}...")
 
-
-async def main():
-    """主服务入口"""
+async def serve_clients(reuse_port=False):
+    """启动 WebSocket 服务"""
+    extensions = []
+    if WS_COMPRESSION == "deflate":
+        extensions.append(ServerPerMessageDeflateFactory(
+            server_max_window_bits=WS_DEFLATE_WINDOW_BITS,
+            client_max_window_bits=WS_DEFLATE_WINDOW_BITS,
+            compress_settings={"memLevel": WS_DEFLATE_MEM_LEVEL}
+        ))
     server = await serve(
         client_handler,
-        "localhost",
-        8765,
+        WS_HOST,
+        WS_PORT,
         ping_interval=PING_INTERVAL,
         ping_timeout=PING_TIMEOUT,
-        max_size=2 ** 20  # 1MB
+        max_size=2 ** 20,  # 1MB
+        subprotocols=available_subprotocols(),
+        compression=None,  # 由 extensions 提供调优后的 permessage-deflate
+        extensions=extensions,
+        reuse_port=reuse_port  # 多个工作进程共享同一端口
     )
-    print(f"服务已启动: ws://localhost:8765")
+    print(f"服务已启动: ws://{WS_HOST}:{WS_PORT} (pid {os.getpid()})")
+    return server
+
 
-    broadcast_task = asyncio.create_task(broadcast_news())
+async def run_forever(tasks, server=None, metrics=None):
+    """运行至取消，然后按顺序清理"""
     try:
         await asyncio.Future()  # 永久运行
     except asyncio.CancelledError:
         print("\n正在关闭服务...")
-        broadcast_task.cancel()
-        server.close()
-        await server.wait_closed()
+        for task in tasks:
+            task.cancel()
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+        if metrics is not None:
+            await metrics.cleanup()
+        if ingest_publisher is not None:
+            await ingest_publisher.close()
+        await news_cache.close()
+        news_cache.adb.close()
+
+
+async def main():
+    """主服务入口（单进程：抓取与 WebSocket 服务在同一进程）"""
+    global news_cache
+    news_cache = NewsCache()
+    server = await serve_clients()
+    metrics = await start_metrics_server(METRICS_PORT, METRICS_HOST)
+
+    tasks = [
+        asyncio.create_task(broadcast_news()),
+        asyncio.create_task(loop_monitor.run()),
+        asyncio.create_task(report_stats()),
+        asyncio.create_task(retention_loop())
+    ]
+    await run_forever(tasks, server, metrics)
+
+
+async def handle_worker_request(message):
+    """抓取进程：处理工作进程转发的请求"""
+    if message.get("action") == "reload":
+        new_articles = await news_cache.fetch(force=True)
+        if new_articles:
+            publish_articles(new_articles)
+
+
+async def run_ingest_leader(worker_count):
+    """多进程模式的抓取进程：唯一写库者，经 Unix 套接字向工作进程推送新文章"""
+    global news_cache, ingest_publisher
+    news_cache = NewsCache()  # 先完成建表/迁移，再启动工作进程
+    ingest_publisher = IngestPublisher(INGEST_SOCKET, on_request=handle_worker_request)
+    await ingest_publisher.start()
+    # 归档/更新使工作进程的历史页缓存失效（回调在数据库线程中执行）
+    loop = asyncio.get_running_loop()
+
+    def invalidate_workers(items, replaced=False):
+        if replaced:
+            loop.call_soon_threadsafe(ingest_publisher.publish, {"type": "invalidate"})
+
+    news_cache.db.add_save_listener(invalidate_workers)
+
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=worker_main, args=(i,), name=f"ws-worker-{i}", daemon=True)
+               for i in range(worker_count)]
+    for worker in workers:
+        worker.start()
+    print(f"抓取进程已启动 (pid {os.getpid()})，工作进程 {worker_count} 个")
+    metrics = await start_metrics_server(METRICS_PORT, METRICS_HOST)
+
+    tasks = [
+        asyncio.create_task(broadcast_news()),
+        asyncio.create_task(loop_monitor.run()),
+        asyncio.create_task(report_stats()),
+        asyncio.create_task(retention_loop())
+    ]
+    try:
+        await run_forever(tasks, metrics=metrics)
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.join(timeout=5)
+
+
+def handle_ingest_message(message):
+    """工作进程：应用抓取进程推送的消息"""
+    if message.get("type") == "articles":
+        fresh = news_cache.apply_published(message.get("articles", []))
+        if fresh:
+            with STAGE_SECONDS.time(stage='broadcast'):
+                clients.publish(fresh)
+            observe_latency(fresh, 'broadcast')
+    elif message.get("type") == "invalidate":
+        news_cache.history_cache.on_saved([], replaced=True)
+        news_cache.article_cache.clear()
+
+
+async def catch_up_from_db():
+    """工作进程（重）连接抓取进程后，从数据库补齐断线期间的新文章"""
+    while True:
+        result = await news_cache.resume(news_cache.replay.last_seq)
+        fresh = news_cache.apply_published(result["articles"])
+        if fresh:
+            clients.publish(fresh)
+        if not result["has_more"]:
+            break
+
+
+async def run_ws_worker(index):
+    """多进程模式的 WebSocket 工作进程：只读数据库，本地维护历史页缓存副本"""
+    global news_cache, ingest_subscriber
+    news_cache = NewsCache(ingest=False)
+    ingest_subscriber = IngestSubscriber(
+        INGEST_SOCKET, on_message=handle_ingest_message, on_connect=catch_up_from_db
+    )
+    server = await serve_clients(reuse_port=True)
+    metrics = await start_metrics_server(METRICS_WORKER_PORT_BASE and METRICS_WORKER_PORT_BASE + index, METRICS_HOST)
+
+    tasks = [
+        asyncio.create_task(ingest_subscriber.run()),
+        asyncio.create_task(loop_monitor.run()),
+        asyncio.create_task(report_stats())
+    ]
+    await run_forever(tasks, server, metrics)
+
+
+def worker_main(index):
+    """工作进程入口"""
+    try:
+        asyncio.run(run_ws_worker(index))
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        if WS_WORKERS > 0:
+            asyncio.run(run_ingest_leader(WS_WORKERS))
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         print("\n服务已安全关闭")
\ No newline at end of file
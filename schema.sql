@@ -8,16 +8,45 @@ CREATE TABLE IF NOT EXISTS news (
     description TEXT,
     link TEXT NOT NULL,
     pub_date DATETIME NOT NULL,
+    pub_ts INTEGER,  -- 发布时间的 UTC 秒级时间戳，用于排序与游标比较
     category TEXT,
     media_url TEXT,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     stock_tickers TEXT,
-    source TEXT
+    source TEXT,
+    seq INTEGER  -- 单调递增的入库序列号，用于断线重连后补发
 
 );
 
 -- 索引优化
 CREATE INDEX IF NOT EXISTS idx_pub_date ON news(pub_date DESC);
 CREATE INDEX IF NOT EXISTS idx_category ON news(category);
+-- 排序与游标分页 (pub_ts, guid) 复合索引
+CREATE INDEX IF NOT EXISTS idx_pub_ts_guid ON news(pub_ts DESC, guid DESC);
+-- 按序列号补发
+CREATE INDEX IF NOT EXISTS idx_seq ON news(seq);
+
+-- 元数据（last_seq 等计数器，归档删除热表数据后仍保持单调）
+CREATE TABLE IF NOT EXISTS news_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+
+-- 标题/描述全文索引（外部内容表，由 save_news 增量维护）
+CREATE VIRTUAL TABLE IF NOT EXISTS news_fts USING fts5(
+    title,
+    description,
+    content='news',
+    content_rowid='rowid'
+);
+
+-- 股票代码倒排表（规范化后的代码 -> 新闻）
+CREATE TABLE IF NOT EXISTS news_tickers (
+    ticker TEXT NOT NULL,
+    pub_ts INTEGER NOT NULL,
+    guid TEXT NOT NULL,
+    PRIMARY KEY (ticker, pub_ts, guid)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_news_tickers_guid ON news_tickers(guid);
 
 COMMIT;
\ No newline at end of file